@@ -0,0 +1,67 @@
+# bench_conflicts.py
+# Crossing check of a new line against the target layer (fillet_conflicts.layer_conflicts) for a
+# line whose end was snapped onto an existing segment: the T-junction must not count as a
+# crossing, also when rounding put the snapped point a few ulps beyond the segment. Needs QGIS.
+
+import math
+
+import pytest
+
+
+class _Index:
+    # the part of LayerSnapIndex that layer_conflicts uses, over a plain QgsSpatialIndex
+    def __init__(self, geoms):
+        from qgis.core import QgsFeature, QgsSpatialIndex
+        self._index = QgsSpatialIndex(QgsSpatialIndex.FlagStoreFeatureGeometries)
+        for fid, geom in enumerate(geoms, 1):
+            feat = QgsFeature(fid)
+            feat.setGeometry(geom)
+            self._index.addFeature(feat)
+
+    def intersecting(self, rect):
+        return self._index.intersects(rect)
+
+    def geometry(self, fid):
+        return self._index.geometry(fid)
+
+
+def _network():
+    # one existing road, not axis-aligned so that snapped points do not fall on it exactly
+    from qgis.core import QgsGeometry, QgsPointXY
+    ax, ay, bx, by = 652310.37, 5401203.91, 653870.13, 5402011.29
+    road = QgsGeometry.fromPolylineXY([QgsPointXY(ax, ay), QgsPointXY(bx, by)])
+    return (ax, ay, bx, by), _Index([road])
+
+
+def _snapped_end(seg, t, ulps):
+    # point at parameter t on the segment, pushed `ulps` units in the last place across it (to the left)
+    ax, ay, bx, by = seg
+    dx, dy = bx - ax, by - ay
+    length = math.hypot(dx, dy)
+    step = ulps * math.ulp(max(abs(ax), abs(ay), abs(bx), abs(by)))
+    return ax + t * dx - dy / length * step, ay + t * dy + dx / length * step
+
+
+@pytest.mark.parametrize('ulps', [0, 2, 8], ids=lambda u: '{}ulp'.format(u))
+def bench_segment_snapped_end(benchmark, ulps):
+    pytest.importorskip('qgis.core')
+    from fillet_digitize.fillet_conflicts import layer_conflicts
+
+    seg, index = _network()
+    # a line coming from the right of the road and ending on (or just past) it
+    ex, ey = _snapped_end(seg, 0.37, ulps)
+    xs = [ex + 180.0, ex + 60.0, ex]
+    ys = [ey - 420.0, ey - 150.0, ey]
+    assert benchmark(layer_conflicts, index, xs, ys) == []
+
+
+def bench_crossing_reported(benchmark):
+    pytest.importorskip('qgis.core')
+    from fillet_digitize.fillet_conflicts import layer_conflicts
+
+    seg, index = _network()
+    # the same approach, continued one metre across the road
+    ex, ey = _snapped_end(seg, 0.37, 0)
+    xs = [ex + 180.0, ex + 60.0, ex - 0.4, ex - 0.8]
+    ys = [ey - 420.0, ey - 150.0, ey + 1.0, ey + 2.0]
+    assert benchmark(layer_conflicts, index, xs, ys) == [1]
@@ -0,0 +1,76 @@
+# bench_kernels.py
+# Micro-benchmarks of the fillet geometry kernels on synthetic polylines.
+
+import functools
+from array import array
+
+import pytest
+
+from fillet_digitize.fillet_core import (
+    fillet_corner, fillet_polyline_xy, polyline_self_intersects, segments_intersect
+)
+from shapes import SHAPES
+
+RADII = [1.0, 10.0, 100.0]
+SEGS_PER_QUARTER = [2, 6, 12]
+
+
+@functools.lru_cache(maxsize=None)
+def sketch(shape, n):
+    coords = SHAPES[shape](n)
+    return array('d', (x for x, _ in coords)), array('d', (y for _, y in coords))
+
+
+@functools.lru_cache(maxsize=None)
+def filleted(shape, n, radius, segs):
+    xs, ys = sketch(shape, n)
+    return fillet_polyline_xy(xs, ys, [radius] * n, segs)
+
+
+@pytest.mark.parametrize('segs', SEGS_PER_QUARTER)
+@pytest.mark.parametrize('radius', RADII)
+@pytest.mark.parametrize('shape', sorted(SHAPES))
+def bench_fillet_corner(run_benchmark, shape, n_vertices, radius, segs):
+    xs, ys = sketch(shape, n_vertices)
+
+    def run():
+        return [fillet_corner(xs[i-1], ys[i-1], xs[i], ys[i], xs[i+1], ys[i+1], radius, segs)
+                for i in range(1, len(xs) - 1)]
+    run_benchmark(run, max(1, n_vertices - 2))
+
+
+@pytest.mark.parametrize('segs', SEGS_PER_QUARTER)
+@pytest.mark.parametrize('radius', RADII)
+@pytest.mark.parametrize('shape', sorted(SHAPES))
+def bench_fillet_polyline_xy(run_benchmark, shape, n_vertices, radius, segs):
+    xs, ys = sketch(shape, n_vertices)
+    radii = [radius] * n_vertices
+    run_benchmark(lambda: fillet_polyline_xy(xs, ys, radii, segs), n_vertices)
+
+
+@pytest.mark.parametrize('segs', SEGS_PER_QUARTER)
+@pytest.mark.parametrize('shape', sorted(SHAPES))
+def bench_polyline_self_intersects(run_benchmark, shape, n_vertices, segs):
+    xs, ys = filleted(shape, n_vertices, 10.0, segs)
+    run_benchmark(lambda: polyline_self_intersects(xs, ys), len(xs))
+
+
+@pytest.mark.parametrize('shape', sorted(SHAPES))
+def bench_segments_intersect(run_benchmark, shape, n_vertices):
+    # every segment against the one two steps further on (the closest non-adjacent pair)
+    xs, ys = sketch(shape, n_vertices)
+    pairs = [(xs[i], ys[i], xs[i+1], ys[i+1], xs[i+2], ys[i+2], xs[i+3], ys[i+3]) for i in range(len(xs) - 3)]
+
+    def run():
+        return [segments_intersect(*p) for p in pairs]
+    run_benchmark(run, max(1, len(pairs)))
+
+
+@pytest.mark.parametrize('segs', SEGS_PER_QUARTER)
+@pytest.mark.parametrize('radius', RADII)
+@pytest.mark.parametrize('shape', sorted(SHAPES))
+def bench_fillet_polyline_numpy(run_benchmark, shape, n_vertices, radius, segs):
+    np = pytest.importorskip('numpy')
+    from fillet_digitize.fillet_numpy import fillet_polyline
+    coords = np.array(SHAPES[shape](n_vertices))
+    run_benchmark(lambda: fillet_polyline(coords, radius, segs), n_vertices)
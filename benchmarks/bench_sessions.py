@@ -0,0 +1,40 @@
+# bench_sessions.py
+# End-to-end latency of recorded digitizing sessions (sessions/*.fsr.gz, recorded with R in the
+# tool). Each recording is replayed through the tool on a headless QGIS canvas; the per-event
+# p50/p95/max go into extra_info, and the layer checksum must match the recording's
+# .expected.json (written by `python -m fillet_digitize.fillet_replay --update`). Needs QGIS.
+
+import json
+import os
+from pathlib import Path
+
+import pytest
+
+SESSIONS = sorted((Path(__file__).resolve().parent / 'sessions').glob('*.fsr.gz'))
+
+
+@pytest.fixture(scope='module')
+def qgis_app():
+    pytest.importorskip('qgis.core')
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from qgis.core import QgsApplication
+    app = QgsApplication([], True)
+    app.initQgis()
+    yield app
+    app.exitQgis()
+
+
+@pytest.mark.parametrize('session', SESSIONS, ids=lambda p: p.name)
+def bench_session_replay(benchmark, qgis_app, session):
+    from fillet_digitize.fillet_replay import expected_path, replay_session
+
+    result = benchmark.pedantic(replay_session, args=(str(session),), rounds=1, iterations=1)
+    benchmark.extra_info['events'] = result['event_count']
+    for row in result['events']:
+        for key in ('p50_ms', 'p95_ms', 'max_ms'):
+            benchmark.extra_info['{}.{}'.format(row['stage'], key)] = row[key]
+    benchmark.extra_info['checksum'] = result['checksum']
+
+    expected = Path(expected_path(str(session)))
+    if expected.exists():
+        assert result['checksum'] == json.loads(expected.read_text())['checksum']
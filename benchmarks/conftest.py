@@ -0,0 +1,71 @@
+# conftest.py
+# Loads the plugin package for headless benchmarking. The package only imports QGIS lazily and
+# the kernels live in the QGIS-free fillet_core module, so no QGIS installation is needed.
+
+import importlib.util
+import sys
+import tracemalloc
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+SIZES = [10, 100, 1000, 10000, 100000]
+
+
+def _load_plugin():
+    # the checkout directory may have any name; import it as the fillet_digitize package
+    if 'fillet_digitize' in sys.modules:
+        return sys.modules['fillet_digitize']
+    spec = importlib.util.spec_from_file_location(
+        'fillet_digitize', ROOT / '__init__.py', submodule_search_locations=[str(ROOT)])
+    mod = importlib.util.module_from_spec(spec)
+    sys.modules['fillet_digitize'] = mod
+    spec.loader.exec_module(mod)
+    return mod
+
+
+_load_plugin()
+
+
+def pytest_addoption(parser):
+    parser.addoption('--bench-max-vertices', type=int, default=SIZES[-1],
+                     help='skip synthetic polylines with more vertices than this')
+
+
+def pytest_generate_tests(metafunc):
+    if 'n_vertices' in metafunc.fixturenames:
+        limit = metafunc.config.getoption('--bench-max-vertices')
+        metafunc.parametrize('n_vertices', [n for n in SIZES if n <= limit])
+
+
+@pytest.fixture
+def run_benchmark(benchmark):
+    """
+    Benchmark fn() and record throughput and memory in the saved JSON:
+    extra_info['items_per_s'] (items / mean time, when timed), plus the peak traced memory and the number of
+    memory blocks still alive after one extra tracemalloc-instrumented call.
+    """
+    def run(fn, items):
+        rounds = max(3, min(50, 200000 // max(1, items)))
+        result = benchmark.pedantic(fn, rounds=rounds, iterations=1, warmup_rounds=1)
+        benchmark.extra_info['items'] = items
+        if benchmark.stats is not None:
+            # no timings under --benchmark-disable
+            benchmark.extra_info['items_per_s'] = items / benchmark.stats.stats.mean
+
+        tracemalloc.start()
+        try:
+            before = tracemalloc.take_snapshot()
+            kept = fn()
+            _, peak = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot()
+        finally:
+            tracemalloc.stop()
+        benchmark.extra_info['peak_bytes'] = peak
+        benchmark.extra_info['alloc_blocks'] = sum(
+            s.count_diff for s in after.compare_to(before, 'filename') if s.count_diff > 0)
+        del kept
+        return result
+    return run
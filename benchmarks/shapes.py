@@ -0,0 +1,43 @@
+# shapes.py
+# Synthetic sketch polylines for the benchmarks, as lists of (x, y) tuples.
+
+import math
+import random
+
+
+def zigzag(n, step=50.0, amplitude=30.0):
+    # alternating corners of roughly 100 degrees, like a winding road centerline
+    return [(i * step, amplitude if i % 2 else 0.0) for i in range(n)]
+
+
+def spiral(n, spacing=40.0):
+    # Archimedean spiral with about constant vertex spacing; corners get sharper towards the middle
+    pts = []
+    theta = 0.5
+    b = spacing / (2 * math.pi)
+    for _ in range(n):
+        r = b * theta * 3.0
+        pts.append((r * math.cos(theta), r * math.sin(theta)))
+        theta += spacing / max(r, spacing)
+    return pts
+
+
+def random_walk(n, step=50.0, seed=1):
+    # heading changes of up to +/-120 degrees: many sharp corners and clamped radii
+    rnd = random.Random(seed)
+    x = y = heading = 0.0
+    pts = [(x, y)]
+    for _ in range(n - 1):
+        heading += rnd.uniform(-2.0 * math.pi / 3, 2.0 * math.pi / 3)
+        length = rnd.uniform(0.3, 1.7) * step
+        x += length * math.cos(heading)
+        y += length * math.sin(heading)
+        pts.append((x, y))
+    return pts
+
+
+SHAPES = {
+    'zigzag': zigzag,
+    'spiral': spiral,
+    'random_walk': random_walk,
+}
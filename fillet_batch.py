@@ -0,0 +1,31 @@
+# fillet_batch.py
+# Worker side of the bulk fillet algorithm. Nothing here imports QGIS, so chunks can be
+# filleted in separate processes; geometries travel as plain lists of (x, y) tuples.
+
+from .fillet_core import fillet_curve_xy, fillet_polyline_xy, fit_radii
+
+
+def fillet_coords(coords, radius, segs_per_quarter, auto_fit=False, curves=False):
+    # fillet one part given as [(x, y), ...] with a single radius for every corner;
+    # with auto_fit, corners are shrunk as far as needed to keep the part free of self-intersections;
+    # with curves, the result is the part's fillet_curve_xy sections instead of a list of vertices
+    xs = [p[0] for p in coords]
+    ys = [p[1] for p in coords]
+    radii = [radius] * len(coords)
+    if auto_fit and len(coords) >= 3:
+        radii = fit_radii(xs, ys, radii, segs_per_quarter)
+    if curves:
+        return fillet_curve_xy(xs, ys, radii)
+    if len(coords) < 3:
+        return list(coords)
+    xs, ys = fillet_polyline_xy(xs, ys, radii, segs_per_quarter)
+    return list(zip(xs, ys))
+
+
+def fillet_chunk(chunk, segs_per_quarter, auto_fit=False, curves=False):
+    """
+    chunk: list of (parts, radius), parts being a list of [(x, y), ...] lists.
+    Returns the filleted parts for every entry, in the same order.
+    """
+    return [[fillet_coords(part, radius, segs_per_quarter, auto_fit, curves) for part in parts]
+            for parts, radius in chunk]
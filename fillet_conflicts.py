@@ -0,0 +1,52 @@
+# fillet_conflicts.py
+# Crossing check of a new line against the existing features of the target layer, using the
+# spatial index the snapper keeps for that layer: a bounding-box query picks the candidates,
+# and only those are tested exactly with a prepared GEOS geometry.
+
+from qgis.core import QgsGeometry, QgsPointXY
+
+# an end point snapped onto a segment can land a few ulps past it; intersections this close to an
+# end of the new line (relative to the size of its coordinates) are such round-off, not crossings
+END_TOLERANCE_REL = 1e-9
+
+
+def layer_conflicts(index, xs, ys, start=0, exclude=()):
+    """
+    Ids of the indexed features that the line (xs[start:], ys[start:]) crosses or overlaps.
+    Touching only at an end point (a line snapped onto the network) is not a conflict, also when
+    the snapped end lies a rounding error beyond the feature (END_TOLERANCE_REL).
+    Features in `exclude` (the one being re-filleted) are skipped.
+    """
+    if index is None or len(xs) - start < 2:
+        return []
+    piece = QgsGeometry.fromPolylineXY([QgsPointXY(x, y) for x, y in zip(xs[start:], ys[start:])])
+    fids = index.intersecting(piece.boundingBox())
+    if not fids:
+        return []
+    engine = QgsGeometry.createGeometryEngine(piece.constGet())
+    engine.prepareGeometry()
+    ends = ((xs[start], ys[start]), (xs[-1], ys[-1]))
+    box = piece.boundingBox()
+    tol = END_TOLERANCE_REL * max(abs(box.xMinimum()), abs(box.xMaximum()), abs(box.yMinimum()),
+                                  abs(box.yMaximum()), box.width(), box.height())
+    conflicts = []
+    for fid in fids:
+        if fid in exclude:
+            continue
+        other = index.geometry(fid).constGet()
+        if engine.intersects(other) and not engine.touches(other):
+            if _only_near(engine.intersection(other), ends, tol):
+                continue
+            conflicts.append(fid)
+    return conflicts
+
+
+def _only_near(geom, points, tol):
+    # does every vertex of geom (an intersection; None when GEOS failed) lie within tol of one of points?
+    if geom is None or geom.isEmpty():
+        return False
+    tol2 = tol * tol
+    for v in geom.vertices():
+        if all((v.x() - x) ** 2 + (v.y() - y) ** 2 > tol2 for x, y in points):
+            return False
+    return True
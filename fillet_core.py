@@ -0,0 +1,920 @@
+# fillet_core.py
+# QGIS-free geometry core of the fillet tool. Everything here works on plain floats; sketch
+# vertices and densified lines are kept in array('d') columns. The map tool converts to
+# QgsPointXY/QgsGeometry only when it talks to rubber bands and layers.
+
+import base64
+import bisect
+import math
+import struct
+import sys
+import zlib
+from array import array
+from fractions import Fraction
+
+# consecutive output vertices closer than this, relative to their coordinate magnitude, are one
+# vertex (rounding noise of the arc sampling); a fixed absolute tolerance fails at large coordinates
+DEDUP_REL = 64 * sys.float_info.epsilon
+
+# Shewchuk's error bound for the floating-point orientation determinant: when |det| is at least
+# this times |detleft| + |detright|, its sign is right (unit roundoff 2**-53)
+_ROUNDOFF = sys.float_info.epsilon / 2
+ORIENT_ERRBOUND = (3.0 + 16.0 * _ROUNDOFF) * _ROUNDOFF
+
+# upper bound for tolerance-driven arc sampling (very large fillets at very large scales)
+MAX_ARC_SEGMENTS = 512
+
+# below this many vertices the per-corner Python path is cheaper than building NumPy arrays
+VECTORIZE_MIN_POINTS = 16
+
+_numpy_kernel = None
+
+
+def _vectorized_kernel():
+    # fillet_numpy.fillet_polyline, imported on first use; False when NumPy is not available
+    global _numpy_kernel
+    if _numpy_kernel is None:
+        try:
+            from .fillet_numpy import fillet_polyline
+            _numpy_kernel = fillet_polyline
+        except ImportError:
+            _numpy_kernel = False
+    return _numpy_kernel
+
+
+def unit(vx, vy):
+    L = math.hypot(vx, vy)
+    return (vx / L, vy / L) if L > 0 else (0.0, 0.0)
+
+def dot(a, b):
+    return a[0]*b[0] + a[1]*b[1]
+
+def normalize_angle(a):
+    while a <= -math.pi:
+        a += 2*math.pi
+    while a > math.pi:
+        a -= 2*math.pi
+    return a
+
+# --- robust segment intersection checks to detect self-crossings in preview/final geometry ---
+# The orientation test is exact in sign at any coordinate magnitude: the float determinant is
+# used when it is certainly large enough (nearly always), exact rational arithmetic otherwise.
+def _orient(ax, ay, bx, by, cx, cy):
+    # > 0 when C is left of AB, < 0 right of it, 0 on the line; only the sign is exact
+    detleft = (bx-ax)*(cy-ay)
+    detright = (by-ay)*(cx-ax)
+    det = detleft - detright
+    if abs(det) >= ORIENT_ERRBOUND * (abs(detleft) + abs(detright)):
+        return det
+    return _orient_exact(ax, ay, bx, by, cx, cy)
+
+def _orient_exact(ax, ay, bx, by, cx, cy):
+    # near-degenerate case: floats convert to fractions exactly
+    try:
+        ax, ay, bx, by, cx, cy = map(Fraction, (ax, ay, bx, by, cx, cy))
+    except (ValueError, OverflowError):
+        return 0  # NaN/inf coordinates
+    det = (bx-ax)*(cy-ay) - (by-ay)*(cx-ax)
+    return (det > 0) - (det < 0)
+
+def _on_segment(ax, ay, bx, by, cx, cy):
+    # is C, known to be on the line AB, on the segment AB
+    return min(ax, bx) <= cx <= max(ax, bx) and min(ay, by) <= cy <= max(ay, by)
+
+def segments_intersect(ax, ay, bx, by, cx, cy, dx, dy):
+    # do segments AB and CD touch or cross; the four orientation tests are _orient, inlined
+    ex, ey = bx - ax, by - ay
+    l = ex*(cy-ay)
+    r = ey*(cx-ax)
+    o1 = l - r
+    if abs(o1) < ORIENT_ERRBOUND * (abs(l) + abs(r)):
+        o1 = _orient_exact(ax, ay, bx, by, cx, cy)
+    l = ex*(dy-ay)
+    r = ey*(dx-ax)
+    o2 = l - r
+    if abs(o2) < ORIENT_ERRBOUND * (abs(l) + abs(r)):
+        o2 = _orient_exact(ax, ay, bx, by, dx, dy)
+    if o1 > 0 and o2 > 0 or o1 < 0 and o2 < 0:
+        return False
+    ex, ey = dx - cx, dy - cy
+    l = ex*(ay-cy)
+    r = ey*(ax-cx)
+    o3 = l - r
+    if abs(o3) < ORIENT_ERRBOUND * (abs(l) + abs(r)):
+        o3 = _orient_exact(cx, cy, dx, dy, ax, ay)
+    l = ex*(by-cy)
+    r = ey*(bx-cx)
+    o4 = l - r
+    if abs(o4) < ORIENT_ERRBOUND * (abs(l) + abs(r)):
+        o4 = _orient_exact(cx, cy, dx, dy, bx, by)
+    if o3 > 0 and o4 > 0 or o3 < 0 and o4 < 0:
+        return False
+    if o1 and o2 and o3 and o4:
+        return True
+    # an end point on the other segment's line: touching when it lies within that segment
+    return (o1 == 0 and _on_segment(ax, ay, bx, by, cx, cy) or
+            o2 == 0 and _on_segment(ax, ay, bx, by, dx, dy) or
+            o3 == 0 and _on_segment(cx, cy, dx, dy, ax, ay) or
+            o4 == 0 and _on_segment(cx, cy, dx, dy, bx, by))
+
+def intersection_point(ax, ay, bx, by, cx, cy, dx, dy):
+    # a point where segments AB and CD meet (they are known to intersect)
+    rx, ry = bx - ax, by - ay
+    sx, sy = dx - cx, dy - cy
+    den = rx*sy - ry*sx
+    if den != 0:
+        t = ((cx-ax)*sy - (cy-ay)*sx) / den
+        t = max(0.0, min(1.0, t))
+        return ax + t*rx, ay + t*ry
+    # colinear overlap: report an endpoint lying on the other segment
+    for qx, qy, s1x, s1y, s2x, s2y in ((cx, cy, ax, ay, bx, by), (dx, dy, ax, ay, bx, by),
+                                       (ax, ay, cx, cy, dx, dy), (bx, by, cx, cy, dx, dy)):
+        if _orient(s1x, s1y, s2x, s2y, qx, qy) == 0 and _on_segment(s1x, s1y, s2x, s2y, qx, qy):
+            return qx, qy
+    return cx, cy
+
+def polyline_intersections(xs, ys, first_seg=0, first_only=False, is_cancelled=None):
+    """
+    Crossings between non-adjacent segments of the open polyline (xs, ys).
+    Segments are bucketed in a uniform grid, so only segments sharing a cell (and overlapping
+    bounding boxes) are compared instead of every pair.
+    Only pairs whose later segment index is >= first_seg are reported; segment k runs from vertex k to k+1.
+    Returns a list of (i, j, x, y) with i < j-1; stops after the first one if first_only.
+    is_cancelled() is polled every few thousand segments (background checks); once it returns
+    True the crossings found so far are returned.
+    """
+    n = len(xs)
+    first_seg = max(2, first_seg)
+    if n < 4 or first_seg >= n - 1:
+        return []
+
+    # bounding box of the segments under test: earlier segments outside it can not cross them
+    tx0, tx1 = min(xs[first_seg:]), max(xs[first_seg:])
+    ty0, ty1 = min(ys[first_seg:]), max(ys[first_seg:])
+
+    boxes = [None] * (n - 1)
+    total_len = 0.0
+    m = 0
+    for k in range(n - 1):
+        x0, x1 = (xs[k], xs[k+1]) if xs[k] <= xs[k+1] else (xs[k+1], xs[k])
+        y0, y1 = (ys[k], ys[k+1]) if ys[k] <= ys[k+1] else (ys[k+1], ys[k])
+        if k < first_seg and (x1 < tx0 or x0 > tx1 or y1 < ty0 or y0 > ty1):
+            continue
+        boxes[k] = (x0, y0, x1, y1)
+        total_len += math.hypot(xs[k+1] - xs[k], ys[k+1] - ys[k])
+        m += 1
+
+    # cell size: about one segment per cell, but never smaller than the mean segment length
+    w = tx1 - tx0
+    h = ty1 - ty0
+    area = w * h if w > 0 and h > 0 else max(w, h) ** 2
+    cell = max(math.sqrt(area / m) if area > 0 else 0.0, total_len / m)
+    if cell <= 0:
+        cell = 1.0
+
+    grid = {}
+    found = []
+    for j in range(n - 1):
+        if is_cancelled is not None and j & 4095 == 0 and is_cancelled():
+            break
+        box = boxes[j]
+        if box is None:
+            continue
+        cells = [(cx, cy)
+                 for cx in range(int(math.floor(box[0] / cell)), int(math.floor(box[2] / cell)) + 1)
+                 for cy in range(int(math.floor(box[1] / cell)), int(math.floor(box[3] / cell)) + 1)]
+        if j >= first_seg:
+            tested = set()
+            for c in cells:
+                for i in grid.get(c, ()):
+                    if i >= j - 1 or i in tested:
+                        continue
+                    tested.add(i)
+                    bi = boxes[i]
+                    if bi[2] < box[0] or bi[0] > box[2] or bi[3] < box[1] or bi[1] > box[3]:
+                        continue
+                    seg = (xs[i], ys[i], xs[i+1], ys[i+1], xs[j], ys[j], xs[j+1], ys[j+1])
+                    if segments_intersect(*seg):
+                        found.append((i, j) + intersection_point(*seg))
+                        if first_only:
+                            return found
+        for c in cells:
+            grid.setdefault(c, []).append(j)
+    found.sort(key=lambda f: (f[1], f[0]))
+    return found
+
+def polyline_self_intersects(xs, ys):
+    # detect intersection between any two non-adjacent segments of open polyline (xs, ys)
+    return len(polyline_intersections(xs, ys, first_only=True)) > 0
+
+def append_unique(xs, ys, x, y):
+    # append (x, y) unless it repeats the current last vertex (up to rounding noise, see DEDUP_REL)
+    if len(xs) > 0:
+        lx, ly = xs[-1], ys[-1]
+        tol = DEDUP_REL * max(abs(lx), abs(ly), abs(x), abs(y))
+        if abs(lx - x) <= tol and abs(ly - y) <= tol:
+            return
+    xs.append(x)
+    ys.append(y)
+
+def arc_segments(radius, sweep, segs_per_quarter=4, max_error=None):
+    # number of chords for an arc of the given sweep (radians): a fixed count per quarter circle,
+    # or, when max_error is given, as few chords as keep the sagitta r*(1-cos(step/2)) <= max_error
+    if max_error is None or max_error <= 0:
+        # small tolerance so exact quarter turns do not get an extra segment from rounding noise
+        return max(1, int(math.ceil(abs(sweep) / (math.pi/2) * segs_per_quarter - 1e-9)))
+    step = 2.0 * math.acos(max(-1.0, min(1.0, 1.0 - max_error / radius))) if radius > 0 else math.pi
+    if step <= 0:
+        return MAX_ARC_SEGMENTS
+    return min(MAX_ARC_SEGMENTS, max(1, int(math.ceil(abs(sweep) / step - 1e-9))))
+
+def fillet_arc(px, py, x, y, nx, ny, radius):
+    """
+    Tangent arc rounding the corner (x, y) between the segments from (px, py) and to (nx, ny).
+    The tangent length is clamped to the shorter adjacent segment, shrinking the radius to match.
+    Returns (t1x, t1y, t2x, t2y, cx, cy, radius, start_angle, sweep), or None when the corner
+    is not filleted (zero-length segment, straight or fully reversed corner).
+    """
+    v1 = (px - x, py - y)
+    v2 = (nx - x, ny - y)
+    l1 = math.hypot(v1[0], v1[1])
+    l2 = math.hypot(v2[0], v2[1])
+    if l1 == 0 or l2 == 0:
+        return None
+    s1 = (v1[0]/l1, v1[1]/l1)
+    s2 = (v2[0]/l2, v2[1]/l2)
+    cos_alpha = max(-1.0, min(1.0, dot(s1, s2)))
+    alpha = math.acos(cos_alpha)
+    if alpha < 1e-6 or abs(math.pi - alpha) < 1e-6:
+        return None
+    t = radius / math.tan(alpha / 2.0)
+    t_max = min(l1, l2)
+    if t > t_max:
+        t = t_max
+        radius_local = t * math.tan(alpha / 2.0)
+        if radius_local <= 0:
+            return None
+        radius = radius_local
+    t1x, t1y = x + s1[0] * t, y + s1[1] * t
+    t2x, t2y = x + s2[0] * t, y + s2[1] * t
+    bis = (s1[0] + s2[0], s1[1] + s2[1])
+    bis_len = math.hypot(bis[0], bis[1])
+    if bis_len == 0:
+        return None
+    bis_u = (bis[0]/bis_len, bis[1]/bis_len)
+    h = radius / math.sin(alpha / 2.0)
+    cx = x + bis_u[0] * h
+    cy = y + bis_u[1] * h
+    a1 = math.atan2(t1y - cy, t1x - cx)
+    a2 = math.atan2(t2y - cy, t2x - cx)
+    d = normalize_angle(a2 - a1)
+    return t1x, t1y, t2x, t2y, cx, cy, radius, a1, d
+
+def _append_arc(xs, ys, arc, segs_per_quarter, max_error):
+    # densified arc (t1x, t1y, t2x, t2y, cx, cy, r, start_angle, sweep), as from fillet_arc
+    t1x, t1y, t2x, t2y, cx, cy, r, a1, d = arc
+    segs = arc_segments(r, d, segs_per_quarter, max_error)
+    append_unique(xs, ys, t1x, t1y)
+    for k in range(1, segs):
+        theta = a1 + d * (k / segs)
+        append_unique(xs, ys, cx + r * math.cos(theta), cy + r * math.sin(theta))
+    append_unique(xs, ys, t2x, t2y)
+
+def append_fillet(xs, ys, px, py, x, y, nx, ny, radius, segs_per_quarter=4, max_error=None):
+    # append the densified fillet of corner (x, y) to xs/ys, skipping repeated vertices
+    arc = fillet_arc(px, py, x, y, nx, ny, radius)
+    if arc is None:
+        append_unique(xs, ys, x, y)
+        return
+    _append_arc(xs, ys, arc, segs_per_quarter, max_error)
+
+# --- concentric offset (edge) lines ---
+# An edge line runs at a fixed offset from the filleted centreline: offset segments joined by arcs
+# around the centreline fillets' own centres, so no buffering of the densified line is needed.
+# Offsets are signed: positive to the left of the direction of digitizing, negative to the right.
+# Sharp corners of the edge are cut off where they would reach further than MITRE_LIMIT * |offset|
+# from the clicked vertex.
+
+MITRE_LIMIT = 4.0
+
+def offset_point(ax, ay, bx, by, offset, at_end=False):
+    # A (or B with at_end) moved sideways by offset from the segment AB
+    ux, uy = unit(bx - ax, by - ay)
+    if at_end:
+        return bx - uy * offset, by + ux * offset
+    return ax - uy * offset, ay + ux * offset
+
+def offset_corner(px, py, x, y, nx, ny, radius, offset):
+    """
+    Corner (x, y) of the edge line at `offset` from the filleted centreline. Returns
+    ('arc', arc) with an arc in the fillet_arc layout, concentric with the centreline's fillet
+    (same centre, radius - offset on the inner side, + offset on the outer side), or
+    ('points', [(x, y), ...]) where the edge has a sharp corner: at corners that are not
+    filleted, and on the inner side when the offset uses up the whole radius, where the two
+    offset segments meet (mitre), cut square to the bisector at MITRE_LIMIT * |offset|.
+    """
+    arc = fillet_arc(px, py, x, y, nx, ny, radius)
+    if arc is not None:
+        t1x, t1y, t2x, t2y, cx, cy, r, a1, d = arc
+        # the centre lies left of the line on left turns (positive sweep)
+        r_off = r - offset if d > 0 else r + offset
+        if r > 0 and d != 0 and r_off > 0:
+            k = r_off / r
+            return 'arc', (cx + (t1x - cx) * k, cy + (t1y - cy) * k, cx + (t2x - cx) * k, cy + (t2y - cy) * k,
+                           cx, cy, r_off, a1, d)
+    ax, ay = offset_point(px, py, x, y, offset, at_end=True)
+    bx, by = offset_point(x, y, nx, ny, offset)
+    ux, uy = x - px, y - py
+    vx, vy = nx - x, ny - y
+    den = ux*vy - uy*vx
+    if den == 0:
+        # straight on (or reversing): the two offset ends, which coincide when going straight
+        return 'points', [(ax, ay), (bx, by)]
+    t = ((bx - ax)*vy - (by - ay)*vx) / den
+    mx, my = ax + ux*t, ay + uy*t
+    limit = MITRE_LIMIT * abs(offset)
+    dist = math.hypot(mx - x, my - y)
+    if dist <= limit:
+        return 'points', [(mx, my)]
+    # clipped mitre: where both offset lines meet the cut line square to the bisector
+    wx, wy = (mx - x) / dist, (my - y) / dist
+    cx, cy = x + wx*limit, y + wy*limit
+    t1 = ((cx - ax)*wx + (cy - ay)*wy) / (ux*wx + uy*wy)
+    t2 = ((cx - bx)*wx + (cy - by)*wy) / (vx*wx + vy*wy)
+    return 'points', [(ax + ux*t1, ay + uy*t1), (bx + vx*t2, by + vy*t2)]
+
+def append_offset_corner(xs, ys, px, py, x, y, nx, ny, radius, offset, segs_per_quarter=4, max_error=None):
+    # append the edge line's piece at corner (x, y) to xs/ys, skipping repeated vertices
+    kind, data = offset_corner(px, py, x, y, nx, ny, radius, offset)
+    if kind == 'arc':
+        _append_arc(xs, ys, data, segs_per_quarter, max_error)
+    else:
+        for qx, qy in data:
+            append_unique(xs, ys, qx, qy)
+
+def offset_polyline_xy(xs, ys, radii, offset, segs_per_quarter=4, max_error=None):
+    # densified edge line of the filleted polyline (xs, ys) at `offset`, as two array('d') columns
+    n = len(xs)
+    out_x = array('d')
+    out_y = array('d')
+    if n < 2:
+        return out_x, out_y
+    append_unique(out_x, out_y, *offset_point(xs[0], ys[0], xs[1], ys[1], offset))
+    for i in range(1, n - 1):
+        append_offset_corner(out_x, out_y, xs[i-1], ys[i-1], xs[i], ys[i], xs[i+1], ys[i+1],
+                             radii[i], offset, segs_per_quarter, max_error)
+    append_unique(out_x, out_y, *offset_point(xs[-2], ys[-2], xs[-1], ys[-1], offset, at_end=True))
+    return out_x, out_y
+
+# section kinds of fillet_curve_xy
+STRAIGHT = 0
+ARC = 1
+
+def fillet_curve_xy(xs, ys, radii, offset=0.0):
+    """
+    The fillet of the open polyline (xs, ys) as exact curves instead of densified vertices:
+    a list of sections (STRAIGHT, sx, sy) holding the vertices of a straight run and
+    (ARC, sx, sy) holding the start, middle and end point of one corner's arc. Consecutive
+    sections share their end point. Corners and radius clamping are those of fillet_polyline_xy;
+    with an offset, the sections are those of the edge line at that offset (offset_corner).
+    """
+    n = len(xs)
+    sections = []
+    if n < 2:
+        return [(STRAIGHT, array('d', xs), array('d', ys))]
+    x0, y0 = offset_point(xs[0], ys[0], xs[1], ys[1], offset) if offset else (xs[0], ys[0])
+    run_x = array('d', (x0,))
+    run_y = array('d', (y0,))
+    for i in range(1, n - 1):
+        kind, data = offset_corner(xs[i-1], ys[i-1], xs[i], ys[i], xs[i+1], ys[i+1], radii[i], offset)
+        if kind != 'arc':
+            for qx, qy in data:
+                append_unique(run_x, run_y, qx, qy)
+            continue
+        t1x, t1y, t2x, t2y, cx, cy, r, a1, d = data
+        append_unique(run_x, run_y, t1x, t1y)
+        if len(run_x) >= 2:
+            sections.append((STRAIGHT, run_x, run_y))
+        # the arc starts exactly where the run ends (t1 may have been merged with its last vertex)
+        mid = a1 + d / 2.0
+        sections.append((ARC, array('d', (run_x[-1], cx + r * math.cos(mid), t2x)),
+                         array('d', (run_y[-1], cy + r * math.sin(mid), t2y))))
+        run_x = array('d', (t2x,))
+        run_y = array('d', (t2y,))
+    ex, ey = offset_point(xs[-2], ys[-2], xs[-1], ys[-1], offset, at_end=True) if offset else (xs[-1], ys[-1])
+    append_unique(run_x, run_y, ex, ey)
+    if len(run_x) == 1 and sections:
+        # the last arc ends at the end point (up to rounding): end it there exactly
+        sections[-1][1][-1] = ex
+        sections[-1][2][-1] = ey
+    if len(run_x) >= 2 or not sections:
+        sections.append((STRAIGHT, run_x, run_y))
+    return sections
+
+def fillet_corner(px, py, x, y, nx, ny, radius, segs_per_quarter=4, max_error=None):
+    # densified fillet of one corner as a list of (x, y)
+    xs = array('d')
+    ys = array('d')
+    append_fillet(xs, ys, px, py, x, y, nx, ny, radius, segs_per_quarter, max_error)
+    return list(zip(xs, ys))
+
+def fillet_polyline_xy(xs, ys, radii, segs_per_quarter=4, max_error=None):
+    """
+    Fillet every interior vertex of the open polyline (xs, ys).
+    radii[i] is the radius used when vertex i is the corner (end values are ignored).
+    Returns the densified line as two array('d') columns. Long lines go through the vectorized
+    NumPy kernel when it is available.
+    """
+    n = len(xs)
+    if n < 3:
+        return array('d', xs), array('d', ys)
+    kernel = _vectorized_kernel()
+    if kernel and n >= VECTORIZE_MIN_POINTS:
+        out = kernel(list(zip(xs, ys)), list(radii), segs_per_quarter, max_error)
+        return array('d', out[:, 0].tolist()), array('d', out[:, 1].tolist())
+    out_x = array('d', (xs[0],))
+    out_y = array('d', (ys[0],))
+    for i in range(1, n - 1):
+        append_fillet(out_x, out_y, xs[i-1], ys[i-1], xs[i], ys[i], xs[i+1], ys[i+1],
+                      radii[i], segs_per_quarter, max_error)
+    append_unique(out_x, out_y, xs[-1], ys[-1])
+    return out_x, out_y
+
+
+# --- auto-fit radii ---
+# The largest radius per corner (up to the requested one) that keeps the filleted line simple.
+
+# fitted tangent lengths leave this fraction of a shared segment free, so the tangent points of
+# neighbouring fillets never meet and rounding noise can not make them overlap
+FIT_MARGIN = 1e-6
+# bisection steps per corner (radius resolution: requested radius / 2**steps)
+FIT_ITERATIONS = 12
+# crossing check / bisection rounds, for corners whose neighbours moved in an earlier round
+FIT_ROUNDS = 3
+
+
+def max_tangent_radii(xs, ys, radii):
+    """
+    Analytic part of the auto-fit: fillet_arc already limits each tangent length to its shorter
+    segment (t_max); here the two fillets sharing a segment must also fit on it together.
+    Overlong pairs are scaled down in proportion, in one forward pass (shrinking a corner never
+    breaks a pair already checked). Returns a list of radii <= radii.
+    """
+    n = len(xs)
+    fitted = list(radii)
+    if n < 3:
+        return fitted
+    seg = [math.hypot(xs[k+1] - xs[k], ys[k+1] - ys[k]) for k in range(n - 1)]
+    tan_half = [0.0] * n
+    t = [0.0] * n
+    for i in range(1, n - 1):
+        l1, l2 = seg[i-1], seg[i]
+        if l1 == 0 or l2 == 0:
+            continue
+        cos_alpha = ((xs[i-1] - xs[i]) * (xs[i+1] - xs[i]) + (ys[i-1] - ys[i]) * (ys[i+1] - ys[i])) / (l1 * l2)
+        alpha = math.acos(max(-1.0, min(1.0, cos_alpha)))
+        if alpha < 1e-6 or abs(math.pi - alpha) < 1e-6:
+            continue  # not filleted
+        tan_half[i] = math.tan(alpha / 2.0)
+        t[i] = min(max(radii[i], 0.0) / tan_half[i], l1, l2)
+    for k in range(1, n - 2):
+        # segment k is shared by corners k and k+1
+        total = t[k] + t[k+1]
+        if total > seg[k]:
+            f = seg[k] * (1.0 - FIT_MARGIN) / total
+            t[k] *= f
+            t[k+1] *= f
+    for i in range(1, n - 1):
+        if tan_half[i] > 0:
+            fitted[i] = min(radii[i], t[i] * tan_half[i])
+    return fitted
+
+
+def _fillet_with_starts(xs, ys, radii, segs_per_quarter, max_error):
+    # pure-Python fillet_polyline_xy that also returns starts[i], the first output vertex of corner i
+    n = len(xs)
+    out_x = array('d', (xs[0],))
+    out_y = array('d', (ys[0],))
+    starts = [0] * n
+    for i in range(1, n - 1):
+        starts[i] = len(out_x)
+        append_fillet(out_x, out_y, xs[i-1], ys[i-1], xs[i], ys[i], xs[i+1], ys[i+1],
+                      radii[i], segs_per_quarter, max_error)
+    starts[n-1] = len(out_x)
+    append_unique(out_x, out_y, xs[-1], ys[-1])
+    return out_x, out_y, starts
+
+
+def _crossing_corners(crossings, starts):
+    # interior corners owning a vertex of a crossing segment
+    last = len(starts) - 1
+    corners = set()
+    for i, j, _, _ in crossings:
+        for v in (i, i + 1, j, j + 1):
+            c = bisect.bisect_right(starts, v) - 1
+            if 0 < c < last:
+                corners.add(c)
+    return sorted(corners)
+
+
+def _piece_crosses(px, py, out_x, out_y, candidates, before, after):
+    # does the piece (px, py) cross one of the candidate segments of the line? The piece's first
+    # segment shares a vertex with segment `before`, its last one with segment `after`
+    last = len(px) - 2
+    for p in range(last + 1):
+        ax, ay, bx, by = px[p], py[p], px[p+1], py[p+1]
+        x0, x1 = (ax, bx) if ax <= bx else (bx, ax)
+        y0, y1 = (ay, by) if ay <= by else (by, ay)
+        for k in candidates:
+            if (p == 0 and k == before) or (p == last and k == after):
+                continue
+            cx, cy, dx, dy = out_x[k], out_y[k], out_x[k+1], out_y[k+1]
+            if max(cx, dx) < x0 or min(cx, dx) > x1 or max(cy, dy) < y0 or min(cy, dy) > y1:
+                continue
+            if segments_intersect(ax, ay, bx, by, cx, cy, dx, dy):
+                return True
+    return False
+
+
+class _SegmentGrid:
+    """
+    Uniform grid over the segments of a line built by _fillet_with_starts, for the bisection's
+    neighbourhood queries. Segments are keyed by the corner owning them (segments starts[c] ..
+    starts[c+1]-1) and their offset from starts[c], so splicing a refitted corner only
+    re-buckets that corner and the one before it.
+    """
+
+    def __init__(self, out_x, out_y, starts):
+        self.out_x = out_x
+        self.out_y = out_y
+        self.starts = starts
+        m = max(1, len(out_x) - 1)
+        w = max(out_x) - min(out_x)
+        h = max(out_y) - min(out_y)
+        area = w * h if w > 0 and h > 0 else max(w, h) ** 2
+        total_len = sum(math.hypot(out_x[k+1] - out_x[k], out_y[k+1] - out_y[k]) for k in range(m))
+        # about one segment per cell, but never smaller than the mean segment length (polyline_intersections)
+        self.cell = max(math.sqrt(area / m) if area > 0 else 0.0, total_len / m) or 1.0
+        self._cells = {}
+        self._owned = [()] * len(starts)  # cells each corner's segments were put in
+        for c in range(len(starts)):
+            self._add(c)
+
+    def _span(self, x0, y0, x1, y1):
+        cell = self.cell
+        return [(cx, cy)
+                for cx in range(int(math.floor(x0 / cell)), int(math.floor(x1 / cell)) + 1)
+                for cy in range(int(math.floor(y0 / cell)), int(math.floor(y1 / cell)) + 1)]
+
+    def _add(self, c):
+        xs, ys, starts = self.out_x, self.out_y, self.starts
+        lo = starts[c]
+        # the end point may have been merged into the last arc (append_unique)
+        hi = min(starts[c+1] if c + 1 < len(starts) else len(xs), len(xs) - 1)
+        owned = []
+        for k in range(lo, hi):
+            for key in self._span(min(xs[k], xs[k+1]), min(ys[k], ys[k+1]),
+                                  max(xs[k], xs[k+1]), max(ys[k], ys[k+1])):
+                self._cells.setdefault(key, set()).add((c, k - lo))
+                owned.append((key, (c, k - lo)))
+        self._owned[c] = owned
+
+    def update(self, c):
+        # corner c's segments changed (spliced, or the first vertex of its successor moved)
+        if not 0 <= c < len(self.starts):
+            return
+        for key, entry in self._owned[c]:
+            self._cells[key].discard(entry)
+        self._add(c)
+
+    def query(self, x0, y0, x1, y1):
+        # indices of the segments in the cells covering the box, in ascending order
+        starts = self.starts
+        found = set()
+        for key in self._span(x0, y0, x1, y1):
+            for c, off in self._cells.get(key, ()):
+                found.add(starts[c] + off)
+        return sorted(found)
+
+
+def _bisect_corner(xs, ys, out_x, out_y, starts, c, r_max, segs_per_quarter, max_error, iterations, grid):
+    """
+    Largest radius <= r_max of corner c whose piece of the line (from the vertex before its
+    arc to the vertex after it) crosses no other segment, the rest of the line kept as it is.
+    Returns (radius, piece) or (r_max, None) when the crossing does not go away at radius 0.
+    """
+    a = starts[c] - 1
+    b = min(starts[c+1], len(out_x) - 1)
+    ax, ay, bx, by = out_x[a], out_y[a], out_x[b], out_y[b]
+
+    def piece(radius):
+        px = array('d', (ax,))
+        py = array('d', (ay,))
+        append_fillet(px, py, xs[c-1], ys[c-1], xs[c], ys[c], xs[c+1], ys[c+1], radius, segs_per_quarter, max_error)
+        append_unique(px, py, bx, by)
+        return px, py
+
+    top = piece(r_max)
+    # pieces of smaller radii stay inside the corner triangle: only segments near it are rechecked
+    x0 = min(min(top[0]), xs[c], ax, bx)
+    x1 = max(max(top[0]), xs[c], ax, bx)
+    y0 = min(min(top[1]), ys[c], ay, by)
+    y1 = max(max(top[1]), ys[c], ay, by)
+    candidates = [k for k in grid.query(x0, y0, x1, y1) if (k < a or k >= b) and
+                  not (max(out_x[k], out_x[k+1]) < x0 or min(out_x[k], out_x[k+1]) > x1 or
+                       max(out_y[k], out_y[k+1]) < y0 or min(out_y[k], out_y[k+1]) > y1)]
+
+    def crosses(pc):
+        return _piece_crosses(pc[0], pc[1], out_x, out_y, candidates, a - 1, b)
+
+    if not crosses(top):
+        return r_max, top
+    best = piece(0.0)
+    if crosses(best):
+        return r_max, None
+    lo, hi = 0.0, r_max
+    for _ in range(iterations):
+        mid = 0.5 * (lo + hi)
+        pc = piece(mid)
+        if crosses(pc):
+            hi = mid
+        else:
+            lo, best = mid, pc
+    return lo, best
+
+
+def fit_radii(xs, ys, radii, segs_per_quarter=4, max_error=None, iterations=FIT_ITERATIONS):
+    """
+    Auto-fit: for every corner of the polyline (xs, ys), the largest radius up to radii[i] that
+    keeps the filleted line free of self-intersections. The analytic limit (max_tangent_radii)
+    settles most corners; corners still taking part in a crossing are bisected, each rechecking
+    only its own arc against the segments around it. Corners of a polygon that crosses itself
+    whatever the radius keep their analytic radius. Returns a list of radii.
+    """
+    fitted = max_tangent_radii(xs, ys, radii)
+    return refit_corners(xs, ys, fitted, 1, (), segs_per_quarter, max_error, iterations)[0]
+
+
+def refit_corners(xs, ys, radii, first=1, skip=(), segs_per_quarter=4, max_error=None, iterations=FIT_ITERATIONS):
+    """
+    Bisection part of fit_radii for the crossings that involve a segment from corner `first`'s
+    arc onwards (the line before it is known to be simple): every corner taking part in one,
+    except those in `skip`, is bisected; radii are not clamped analytically first. Returns
+    (radii, unfixed) with unfixed the corners whose crossing does not go away at radius 0.
+    """
+    fitted = list(radii)
+    n = len(xs)
+    unfixed = []
+    if n < 4 or not 0 < first < n - 1:
+        return fitted, unfixed
+    skip = set(skip)
+    out_x, out_y, starts = _fillet_with_starts(xs, ys, fitted, segs_per_quarter, max_error)
+    grid = _SegmentGrid(out_x, out_y, starts)
+    for _ in range(FIT_ROUNDS):
+        changed = False
+        for c in _crossing_corners(polyline_intersections(out_x, out_y, starts[first] - 1), starts):
+            if c in skip:
+                continue
+            r, pc = _bisect_corner(xs, ys, out_x, out_y, starts, c, fitted[c], segs_per_quarter, max_error,
+                                   iterations, grid)
+            if pc is None:
+                # the clicked polygon itself crosses here: no radius helps, do not retry
+                skip.add(c)
+                unfixed.append(c)
+                continue
+            if r >= fitted[c]:
+                continue
+            _splice_corner(out_x, out_y, starts, c, pc)
+            # the piece also replaced the first vertex after corner c-1's segments
+            grid.update(c - 1)
+            grid.update(c)
+            fitted[c] = r
+            changed = True
+        if not changed:
+            break
+    return fitted, unfixed
+
+
+def _splice_corner(out_x, out_y, starts, c, pc):
+    # replace corner c's piece of the filleted line by the refitted one from _bisect_corner
+    a = starts[c] - 1
+    b = min(starts[c+1], len(out_x) - 1)
+    delta = (len(pc[0]) - 2) - (b - a - 1)
+    out_x[a+1:b] = pc[0][1:-1]
+    out_y[a+1:b] = pc[1][1:-1]
+    for k in range(c + 1, len(starts)):
+        starts[k] += delta
+
+# --- control polygon encoding ---
+# A finished line can carry its clicked vertices and per-corner radii in one text attribute, so
+# it can be re-filleted later. Layout (little-endian, zlib-compressed, base64 text after the
+# prefix): default radius (d), segments per quarter (i), vertex count (i), then the x, y and
+# radius columns as doubles. A NaN radius means the corner follows the default radius.
+# Coordinates and radii are in the units of the layer's CRS, whatever CRS the line was drawn in.
+
+CONTROL_PREFIX = 'FC1:'
+DEFAULT_CONTROL_FIELD = 'fillet_ctl'
+_CONTROL_HEADER = struct.Struct('<dii')
+
+
+def _le_bytes(values):
+    col = array('d', values)
+    if sys.byteorder == 'big':
+        col.byteswap()
+    return col.tobytes()
+
+
+def _le_array(raw):
+    col = array('d')
+    col.frombytes(raw)
+    if sys.byteorder == 'big':
+        col.byteswap()
+    return col
+
+
+def encode_control(xs, ys, radii, default_radius, segs_per_quarter):
+    n = len(xs)
+    raw = (_CONTROL_HEADER.pack(float(default_radius), int(segs_per_quarter), n)
+           + _le_bytes(xs) + _le_bytes(ys)
+           + _le_bytes(math.nan if r is None else r for r in radii))
+    return CONTROL_PREFIX + base64.b64encode(zlib.compress(raw, 9)).decode('ascii')
+
+
+def decode_control(text):
+    """
+    Inverse of encode_control: (xs, ys, radii, default_radius, segs_per_quarter), the three columns
+    as array('d'). Raises ValueError for anything that is not an encoded control polygon.
+    """
+    if not isinstance(text, str) or not text.startswith(CONTROL_PREFIX):
+        raise ValueError('not a fillet control polygon')
+    try:
+        raw = zlib.decompress(base64.b64decode(text[len(CONTROL_PREFIX):]))
+    except Exception as e:
+        raise ValueError('corrupt fillet control polygon: {}'.format(e))
+    head = _CONTROL_HEADER.size
+    if len(raw) < head:
+        raise ValueError('corrupt fillet control polygon')
+    default_radius, segs, n = _CONTROL_HEADER.unpack_from(raw)
+    if n < 0 or len(raw) != head + 24 * n:
+        raise ValueError('corrupt fillet control polygon')
+    cols = [_le_array(raw[head + 8 * n * k:head + 8 * n * (k + 1)]) for k in range(3)]
+    return cols[0], cols[1], cols[2], default_radius, segs
+
+
+def resolve_radii(radii, default_radius):
+    # per-corner radii with NaN/None replaced by the default radius
+    return [default_radius if r is None or math.isnan(r) else r for r in radii]
+
+
+class Sketch:
+    """
+    Placed vertices of the line being digitized and their per-corner radii, as array('d') columns.
+    A NaN radius means the corner follows the tool's global radius.
+    """
+    __slots__ = ('xs', 'ys', 'radii', 'revision')
+
+    def __init__(self):
+        self.xs = array('d')
+        self.ys = array('d')
+        self.radii = array('d')
+        self.revision = 0  # bumped on every edit, for results derived from the sketch
+
+    def __len__(self):
+        return len(self.xs)
+
+    def append(self, x, y, radius=None):
+        self.xs.append(x)
+        self.ys.append(y)
+        self.radii.append(math.nan if radius is None else radius)
+        self.revision += 1
+
+    def pop(self):
+        self.revision += 1
+        r = self.radii.pop()
+        return self.xs.pop(), self.ys.pop(), None if math.isnan(r) else r
+
+    def point(self, i):
+        return self.xs[i], self.ys[i]
+
+    def radius(self, i):
+        # per-corner radius of vertex i, None when it follows the global radius
+        r = self.radii[i]
+        return None if math.isnan(r) else r
+
+    def set_radius(self, i, radius):
+        self.radii[i] = math.nan if radius is None else radius
+        self.revision += 1
+
+    def replace_coords(self, xs, ys):
+        # the same vertices in other coordinates (after a CRS change)
+        self.xs = array('d', xs)
+        self.ys = array('d', ys)
+        self.revision += 1
+
+    def clear(self):
+        self.revision += 1
+        del self.xs[:]
+        del self.ys[:]
+        del self.radii[:]
+
+
+class FilletPreviewCache:
+    """
+    Densified fillet arcs of the committed part of a sketch.
+    Corner i (1 <= i <= len(sketch)-2) only depends on placed points, so its arc is computed once
+    and kept until a point or radius near it changes; the tool then only rebuilds the tail corner
+    that follows the mouse. With offsets, the edge lines at those offsets are built in the same
+    pass: edges[k] is the (xs, ys) prefix of the edge at offsets[k].
+    """
+
+    def __init__(self):
+        self.revision = 0  # bumped whenever the prefix changes, for caches derived from it
+        self.clear()
+
+    def clear(self):
+        self.revision += 1
+        self._sampling = None  # (segs_per_quarter, max_error, offsets) the cached arcs were sampled with
+        self.xs = array('d')   # densified prefix: first vertex + arcs of cached corners
+        self.ys = array('d')
+        self.offsets = ()
+        self.edges = []
+        self._edge_ends = []   # _edge_ends[i]: lengths of the edges once corner i is included
+        self.crossings = []    # self-intersections of the prefix, as returned by polyline_intersections
+        self._ends = []        # _ends[i]: len(self.xs) once corner i is included (_ends[0] -> first vertex)
+        self._ncross = []      # _ncross[i]: len(self.crossings) once corner i is included
+
+    @property
+    def valid(self):
+        return len(self.crossings) == 0
+
+    def invalidate(self, corner):
+        # drop corner `corner` and everything after it
+        corner = max(0, corner)
+        if corner >= len(self._ends):
+            return
+        self.revision += 1
+        del self._ends[corner:]
+        del self._ncross[corner:]
+        keep = self._ends[-1] if self._ends else 0
+        del self.xs[keep:]
+        del self.ys[keep:]
+        del self.crossings[self._ncross[-1] if self._ncross else 0:]
+        del self._edge_ends[corner:]
+        for k, (exs, eys) in enumerate(self.edges):
+            keep = self._edge_ends[-1][k] if self._edge_ends else 0
+            del exs[keep:]
+            del eys[keep:]
+
+    def invalidate_point(self, index):
+        # moving/removing point `index` changes corners index-1 .. index+1
+        self.invalidate(index - 1 if index > 0 else 0)
+
+    def sync(self, sketch, radius_for, segs, max_error=None, offsets=()):
+        # extend the prefix up to corner len(sketch)-2; radius_for(i) gives the radius of corner i
+        offsets = tuple(offsets)
+        if len(sketch) == 0 or self._sampling != (segs, max_error, offsets):
+            self.clear()
+            self._sampling = (segs, max_error, offsets)
+            self.offsets = offsets
+            self.edges = [(array('d'), array('d')) for _ in offsets]
+        if len(sketch) == 0:
+            return
+        xs, ys = sketch.xs, sketch.ys
+        if not self._ends:
+            self.xs.append(xs[0])
+            self.ys.append(ys[0])
+            self._ends = [1]
+            self._ncross = [0]
+        if offsets and not self._edge_ends and len(sketch) >= 2:
+            # edges start beside the first vertex, square to the first segment
+            for (exs, eys), offset in zip(self.edges, offsets):
+                append_unique(exs, eys, *offset_point(xs[0], ys[0], xs[1], ys[1], offset))
+            self._edge_ends = [tuple(len(e[0]) for e in self.edges)]
+        first = len(self._ends)
+        if first >= len(sketch) - 1:
+            return
+        start = len(self.xs)
+        for i in range(first, len(sketch) - 1):
+            radius = radius_for(i)
+            append_fillet(self.xs, self.ys, xs[i-1], ys[i-1], xs[i], ys[i], xs[i+1], ys[i+1],
+                          radius, segs, max_error)
+            for (exs, eys), offset in zip(self.edges, offsets):
+                append_offset_corner(exs, eys, xs[i-1], ys[i-1], xs[i], ys[i], xs[i+1], ys[i+1],
+                                     radius, offset, segs, max_error)
+            self._ends.append(len(self.xs))
+            if offsets:
+                self._edge_ends.append(tuple(len(e[0]) for e in self.edges))
+        self.revision += 1
+        # one crossing check for all the new corners; a crossing belongs to the corner that owns its
+        # later segment (corner c adds segments _ends[c-1]-1 .. _ends[c]-2)
+        found = polyline_intersections(self.xs, self.ys, start - 1)
+        owners = [bisect.bisect_left(self._ends, j + 2, first) for _, j, _, _ in found]
+        order = sorted(range(len(found)), key=owners.__getitem__)
+        self.crossings.extend(found[k] for k in order)
+        counts = [0] * (len(self._ends) - first)
+        for c in owners:
+            counts[c - first] += 1
+        n = len(self.crossings) - len(found)
+        for count in counts:
+            n += count
+            self._ncross.append(n)
@@ -0,0 +1,176 @@
+# fillet_crs.py
+# Coordinate reference systems of the digitizing tool. Clicks arrive in the map canvas CRS and
+# lines are written in the target layer's CRS; fillets are computed in a working CRS, which is
+# the canvas CRS (the historical behaviour), the layer CRS, or a local metric CRS so that radii
+# are metres. The transforms are built once per activation and rebuilt on CRS changes only.
+
+import math
+
+from qgis.PyQt.QtCore import QObject, pyqtSignal
+from qgis.core import (
+    QgsCoordinateReferenceSystem, QgsCoordinateTransform, QgsCsException, QgsLineString, QgsPointXY,
+    QgsProject
+)
+
+WORK_CANVAS = 'canvas'
+WORK_LAYER = 'layer'
+WORK_LOCAL = 'local'
+WORK_CRS_MODES = (WORK_CANVAS, WORK_LAYER, WORK_LOCAL)
+
+_WGS84 = QgsCoordinateReferenceSystem('EPSG:4326')
+
+
+def local_metric_crs(lon, lat):
+    # transverse Mercator centred on (lon, lat): metres, with negligible scale error near the centre
+    return QgsCoordinateReferenceSystem.fromProj(
+        '+proj=tmerc +lat_0={:.8f} +lon_0={:.8f} +k=1 +x_0=0 +y_0=0 +ellps=WGS84 +units=m +no_defs'.format(lat, lon))
+
+
+def transform_xy(ct, xs, ys):
+    # transform coordinate columns in one call (ct None -> unchanged); returns lists
+    if ct is None:
+        return xs, ys
+    line = QgsLineString(list(xs), list(ys))
+    line.transform(ct)
+    return line.xVector(), line.yVector()
+
+
+class ToolCrs(QObject):
+    """
+    Transforms between the canvas CRS, the target layer's CRS and the working CRS. A transform
+    is None when both sides are the same CRS. `changed` is emitted with the previous working
+    CRS after every rebuild, so coordinates kept in it can be moved over.
+    """
+    changed = pyqtSignal(object)
+
+    def __init__(self, canvas, parent=None):
+        super().__init__(parent)
+        self.canvas = canvas
+        self.layer = None
+        self.mode = WORK_CANVAS
+        self.work_crs = None
+        self._origin = None  # (lon, lat) the local metric CRS is centred on
+        self.canvas_to_work = None
+        self.work_to_canvas = None
+        self.work_to_layer = None
+        self.layer_to_work = None
+        self.canvas_to_layer = None
+        self.work_per_canvas = 1.0  # work CRS units per canvas unit, near the canvas centre
+        self._attached = False
+
+    def attach(self, layer):
+        # follow the CRSs of the canvas, the project and `layer` (tool activation / layer switch)
+        self.detach()
+        self.layer = layer
+        self.canvas.destinationCrsChanged.connect(self.refresh)
+        QgsProject.instance().transformContextChanged.connect(self.refresh)
+        if layer is not None:
+            layer.crsChanged.connect(self.refresh)
+        self._attached = True
+        self.refresh()
+
+    def detach(self):
+        if not self._attached:
+            return
+        self._attached = False
+        try:
+            self.canvas.destinationCrsChanged.disconnect(self.refresh)
+            QgsProject.instance().transformContextChanged.disconnect(self.refresh)
+            if self.layer is not None:
+                self.layer.crsChanged.disconnect(self.refresh)
+        except (TypeError, RuntimeError):
+            pass
+
+    def set_mode(self, mode):
+        if mode not in WORK_CRS_MODES:
+            raise ValueError('unknown working CRS mode: {}'.format(mode))
+        self.mode = mode
+        self._origin = None
+        self.refresh()
+
+    def set_local_origin(self, pt):
+        # centre the local metric CRS on the canvas point pt (the first vertex of a new line)
+        if self.mode != WORK_LOCAL:
+            return
+        try:
+            ct = self._transform(self.canvas_crs(), _WGS84)
+            geo = ct.transform(pt) if ct is not None else pt
+        except QgsCsException:
+            return
+        self._origin = (geo.x(), geo.y())
+        self.refresh()
+
+    def canvas_crs(self):
+        return self.canvas.mapSettings().destinationCrs()
+
+    def layer_crs(self):
+        return self.layer.crs() if self.layer is not None else self.canvas_crs()
+
+    def refresh(self):
+        canvas = self.canvas_crs()
+        layer = self.layer_crs()
+        if self.mode == WORK_LAYER:
+            work = layer
+        elif self.mode == WORK_LOCAL and self._origin is not None:
+            work = local_metric_crs(*self._origin)
+        else:
+            work = canvas
+        old = self.work_crs
+        self.work_crs = work
+        self.canvas_to_work = self._transform(canvas, work)
+        self.work_to_canvas = self._transform(work, canvas)
+        self.work_to_layer = self._transform(work, layer)
+        self.layer_to_work = self._transform(layer, work)
+        self.canvas_to_layer = self._transform(canvas, layer)
+        self.work_per_canvas = self._scale(self.canvas_to_work)
+        self.changed.emit(old)
+
+    @staticmethod
+    def _transform(src, dst):
+        if not src.isValid() or not dst.isValid() or src == dst:
+            return None
+        return QgsCoordinateTransform(src, dst, QgsProject.instance().transformContext())
+
+    def _scale(self, ct):
+        # length ratio of a short canvas segment at the canvas centre after transforming it
+        if ct is None:
+            return 1.0
+        try:
+            c = self.canvas.extent().center()
+            d = max(self.canvas.mapUnitsPerPixel(), 1e-12) * 100.0
+            a = ct.transform(c)
+            b = ct.transform(QgsPointXY(c.x() + d, c.y()))
+        except (QgsCsException, AttributeError):
+            return 1.0
+        ratio = a.distance(b) / d
+        return ratio if ratio > 0 else 1.0
+
+    def layer_per_work(self, x, y):
+        # layer CRS units per working CRS unit around the working point (x, y), for lengths such as
+        # radii; where the two differ in shape (e.g. degrees vs metres) the mean over both axes
+        ct = self.work_to_layer
+        if ct is None:
+            return 1.0
+        d = max(abs(x), abs(y), 1.0) * 1e-6
+        try:
+            a = ct.transform(QgsPointXY(x, y))
+            b = ct.transform(QgsPointXY(x + d, y))
+            c = ct.transform(QgsPointXY(x, y + d))
+        except QgsCsException:
+            return 1.0
+        area = abs((b.x() - a.x()) * (c.y() - a.y()) - (b.y() - a.y()) * (c.x() - a.x()))
+        ratio = math.sqrt(area) / d
+        return ratio if ratio > 0 else 1.0
+
+    def to_work(self, pt):
+        # canvas point -> (x, y) in the working CRS
+        if self.canvas_to_work is None:
+            return pt.x(), pt.y()
+        p = self.canvas_to_work.transform(pt)
+        return p.x(), p.y()
+
+    def to_canvas(self, x, y):
+        # working CRS (x, y) -> canvas QgsPointXY
+        if self.work_to_canvas is None:
+            return QgsPointXY(x, y)
+        return self.work_to_canvas.transform(QgsPointXY(x, y))
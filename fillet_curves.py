@@ -0,0 +1,31 @@
+# fillet_curves.py
+# True-arc output: the sections of fillet_core.fillet_curve_xy as a QgsCompoundCurve of straight
+# runs and one three-point circular string per corner. Layers whose provider can not store curves
+# keep receiving densified lines.
+
+from qgis.core import QgsCircularString, QgsCompoundCurve, QgsLineString, QgsMultiCurve, QgsPoint, QgsWkbTypes
+
+from .fillet_core import ARC
+
+
+def supports_curves(layer):
+    # curved geometry types are only offered by providers that store curves
+    return layer is not None and QgsWkbTypes.isCurvedType(layer.wkbType())
+
+
+def compound_curve(sections):
+    curve = QgsCompoundCurve()
+    for kind, xs, ys in sections:
+        if kind == ARC:
+            curve.addCurve(QgsCircularString(QgsPoint(xs[0], ys[0]), QgsPoint(xs[1], ys[1]), QgsPoint(xs[2], ys[2])))
+        elif len(xs) >= 2:
+            curve.addCurve(QgsLineString(list(xs), list(ys)))
+    return curve
+
+
+def multi_curve(parts):
+    # one compound curve per part's sections
+    multi = QgsMultiCurve()
+    for sections in parts:
+        multi.addGeometry(compound_curve(sections))
+    return multi
@@ -1,9 +1,9 @@
 import os
 from qgis.PyQt.QtWidgets import QAction
 from qgis.PyQt.QtGui import QIcon
-from qgis.core import QgsProject
+from qgis.core import QgsProject, QgsApplication
 from qgis.gui import QgsMapTool
-from .fillet_tool import FilletDigitizeTool  # 将你的核心逻辑移到 fillet_tool.py
+from .fillet_processing import FilletDigitizeProvider
 
 
 class FilletDigitizePlugin:
@@ -12,8 +12,13 @@ class FilletDigitizePlugin:
         self.canvas = iface.mapCanvas()
         self.action = None
         self.tool = None
+        self.provider = None
 
     def initGui(self):
+        # bulk "Fillet lines" algorithm in the Processing toolbox
+        self.provider = FilletDigitizeProvider()
+        QgsApplication.processingRegistry().addProvider(self.provider)
+
         icon_path = os.path.join(os.path.dirname(__file__), "icons", "icon.svg")
         self.action = QAction(
             QIcon(icon_path),
@@ -26,6 +31,9 @@ class FilletDigitizePlugin:
         self.iface.addPluginToVectorMenu("Fillet Digitize", self.action)
 
     def unload(self):
+        if self.provider is not None:
+            QgsApplication.processingRegistry().removeProvider(self.provider)
+            self.provider = None
         self.iface.removeToolBarIcon(self.action)
         self.iface.removePluginVectorMenu("Fillet Digitize", self.action)
         if self.tool and self.canvas.mapTool() == self.tool:
@@ -50,6 +58,8 @@ class FilletDigitizePlugin:
 
         # Create or reuse tool
         if self.tool is None:
+            # the map tool (and the geometry core behind it) is only imported on first use
+            from .fillet_tool import FilletDigitizeTool
             self.tool = FilletDigitizeTool(self.canvas, layer, radius=30.0, segs_per_quarter=12)
         else:
             self.tool.layer = layer
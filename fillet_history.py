@@ -0,0 +1,93 @@
+# fillet_history.py
+# Undo/redo for the digitizing tool as small reversible operations instead of full snapshots:
+# every step costs O(1) to record, undo and redo, whatever the sketch length.
+
+from collections import deque
+
+DEFAULT_HISTORY_DEPTH = 1000
+
+
+class AddPoint:
+    __slots__ = ('point', 'radius')
+
+    def __init__(self, point, radius=None):
+        self.point = point
+        self.radius = radius
+
+    def apply(self, sketch):
+        sketch.append_point(self.point, self.radius)
+
+    def revert(self, sketch):
+        sketch.pop_point()
+
+
+class SetCornerRadius:
+    __slots__ = ('index', 'old', 'new')
+
+    def __init__(self, index, old, new):
+        self.index = index
+        self.old = old
+        self.new = new
+
+    def apply(self, sketch):
+        sketch.set_corner_radius(self.index, self.new)
+
+    def revert(self, sketch):
+        sketch.set_corner_radius(self.index, self.old)
+
+
+class SketchHistory:
+    """
+    Undo and redo stacks of steps. A step is a list of operations applied in order, together with
+    the sketch's next_point_radius to restore (the temporary per-corner override is not part of
+    any operation, so it is carried alongside as a single value).
+    The sketch must provide append_point(pt, radius), pop_point(), set_corner_radius(i, r) and
+    a next_point_radius attribute. At most max_depth steps are kept on each stack.
+    """
+
+    def __init__(self, max_depth=DEFAULT_HISTORY_DEPTH):
+        self._undo = deque(maxlen=max_depth)
+        self._redo = deque(maxlen=max_depth)
+
+    @property
+    def max_depth(self):
+        return self._undo.maxlen
+
+    @max_depth.setter
+    def max_depth(self, value):
+        self._undo = deque(self._undo, maxlen=value)
+        self._redo = deque(self._redo, maxlen=value)
+
+    def can_undo(self):
+        return len(self._undo) > 0
+
+    def can_redo(self):
+        return len(self._redo) > 0
+
+    def clear(self):
+        self._undo.clear()
+        self._redo.clear()
+
+    def record(self, ops, next_radius):
+        # a new user action: ops have already been applied; next_radius is the override before them
+        self._undo.append((ops, next_radius))
+        self._redo.clear()
+
+    def record_redo(self, ops, next_radius):
+        # ops were just reverted without being on the undo stack (Backspace removing a point
+        # with nothing left to undo); redo applies them again
+        self._redo.append((ops, next_radius))
+
+    def undo(self, sketch):
+        ops, next_radius = self._undo.pop()
+        self._redo.append((ops, sketch.next_point_radius))
+        for op in reversed(ops):
+            op.revert(sketch)
+        sketch.next_point_radius = next_radius
+
+    def redo(self, sketch):
+        ops, next_radius = self._redo.pop()
+        self._undo.append((ops, sketch.next_point_radius))
+        for op in ops:
+            op.apply(sketch)
+        sketch.next_point_radius = next_radius
@@ -0,0 +1,104 @@
+# fillet_numpy.py
+# Vectorized fillet kernel: the same construction as fillet_core.fillet_arc,
+# evaluated for every corner of a polyline at once with NumPy array operations.
+
+import numpy as np
+
+from .fillet_core import DEDUP_REL, MAX_ARC_SEGMENTS
+
+
+def fillet_polyline(coords, radii, segs_per_quarter=6, max_error=None):
+    """
+    Fillet every interior vertex of an open polyline.
+    coords: array-like [N, 2] of vertices.
+    radii: array-like [N] (or a scalar) giving the radius used when vertex i is the corner;
+           the values at both end points are ignored.
+    max_error: optional chord error; arcs are then sampled as in fillet_core.arc_segments.
+    Returns an [M, 2] float array with the densified polyline, matching what
+    fillet_core.fillet_polyline_xy produces for the same input.
+    """
+    P = np.asarray(coords, dtype=float).reshape(-1, 2)
+    n = len(P)
+    if n < 3:
+        return P.copy()
+    R = np.broadcast_to(np.asarray(radii, dtype=float), (n,))[1:-1]
+
+    cur = P[1:-1]
+    v1 = P[:-2] - cur
+    v2 = P[2:] - cur
+    l1 = np.hypot(v1[:, 0], v1[:, 1])
+    l2 = np.hypot(v2[:, 0], v2[:, 1])
+    degenerate = (l1 == 0) | (l2 == 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        s1 = v1 / l1[:, None]
+        s2 = v2 / l2[:, None]
+        cos_alpha = np.clip(s1[:, 0]*s2[:, 0] + s1[:, 1]*s2[:, 1], -1.0, 1.0)
+        alpha = np.arccos(cos_alpha)
+        # collinear (straight through) or fully reversed corners are not filleted
+        degenerate |= ~np.isfinite(alpha) | (alpha < 1e-6) | (np.abs(np.pi - alpha) < 1e-6)
+        half = alpha / 2.0
+        tan_half = np.tan(half)
+        t = R / tan_half
+        # clamp the tangent length to the shorter adjacent segment, shrinking the radius to match
+        t_max = np.minimum(l1, l2)
+        clamped = t > t_max
+        t = np.where(clamped, t_max, t)
+        radius = np.where(clamped, t * tan_half, R)
+        degenerate |= clamped & ~(radius > 0)
+
+        T1 = cur + s1 * t[:, None]
+        T2 = cur + s2 * t[:, None]
+        bis = s1 + s2
+        bis_len = np.hypot(bis[:, 0], bis[:, 1])
+        degenerate |= bis_len == 0
+        h = radius / np.sin(half)
+        C = cur + bis / bis_len[:, None] * h[:, None]
+        a1 = np.arctan2(T1[:, 1] - C[:, 1], T1[:, 0] - C[:, 0])
+        a2 = np.arctan2(T2[:, 1] - C[:, 1], T2[:, 0] - C[:, 0])
+    # wrap the sweep into (-pi, pi]
+    d = a2 - a1
+    d = np.where(d <= -np.pi, d + 2*np.pi, d)
+    d = np.where(d > np.pi, d - 2*np.pi, d)
+    d[degenerate] = 0.0
+    if max_error is None or max_error <= 0:
+        segs = np.maximum(1, np.ceil(np.abs(d) / (np.pi/2) * segs_per_quarter - 1e-9))
+    else:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            step = 2.0 * np.arccos(np.clip(1.0 - max_error / radius, -1.0, 1.0))
+        step = np.where(radius > 0, step, np.pi)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            segs = np.ceil(np.abs(d) / step - 1e-9)
+        segs = np.clip(np.nan_to_num(segs, nan=1.0, posinf=MAX_ARC_SEGMENTS), 1, MAX_ARC_SEGMENTS)
+    segs = segs.astype(np.int64)
+    segs[degenerate] = 0
+
+    # one output row per arc vertex (segs + 1 per corner, a single vertex for degenerate corners)
+    counts = segs + 1
+    total = int(counts.sum())
+    corner = np.repeat(np.arange(n - 2), counts)
+    starts = np.cumsum(counts) - counts
+    k = np.arange(total) - np.repeat(starts, counts)
+
+    steps = np.maximum(segs, 1)[corner]
+    theta = a1[corner] + d[corner] * (k / steps)
+    r = radius[corner]
+    arcs = np.empty((total, 2))
+    with np.errstate(invalid='ignore'):
+        arcs[:, 0] = C[corner, 0] + r * np.cos(theta)
+        arcs[:, 1] = C[corner, 1] + r * np.sin(theta)
+    first = k == 0
+    last = k == segs[corner]
+    arcs[first] = T1[corner[first]]
+    arcs[last] = T2[corner[last]]
+    flat = degenerate[corner]
+    arcs[flat] = cur[corner[flat]]
+
+    out = np.concatenate((P[:1], arcs, P[-1:]))
+    # drop vertices repeating their predecessor (tangent points that coincide with a vertex, zero radii)
+    # (rounding noise relative to the coordinate magnitude, as fillet_core.append_unique)
+    step = np.abs(np.diff(out, axis=0))
+    mag = np.abs(out).max(axis=1)
+    tol = DEDUP_REL * np.maximum(mag[1:], mag[:-1])
+    keep = np.ones(len(out), dtype=bool)
+    keep[1:] = (step[:, 0] > tol) | (step[:, 1] > tol)
+    return out[keep]
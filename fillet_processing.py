@@ -0,0 +1,331 @@
+# fillet_processing.py
+# Processing provider with a bulk "Fillet lines" algorithm: the same fillet construction the
+# digitizing tool uses, applied to every feature of an existing line layer, and "Re-fillet lines"
+# that regenerates tool-digitized lines from their stored control polygons.
+
+import os
+import sys
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from qgis.PyQt.QtGui import QIcon
+from qgis.core import (
+    QgsProcessing, QgsProcessingAlgorithm, QgsProcessingFeatureBasedAlgorithm, QgsProcessingProvider,
+    QgsProcessingException, QgsProcessingParameterString,
+    QgsProcessingParameterFeatureSource, QgsProcessingParameterFeatureSink,
+    QgsProcessingParameterDistance, QgsProcessingParameterNumber, QgsProcessingParameterField,
+    QgsProcessingParameterDefinition, QgsProcessingParameterBoolean, QgsFeature, QgsFeatureSink, QgsGeometry, QgsPointXY,
+    QgsWkbTypes
+)
+
+
+def _process_pool(workers):
+    # QGIS embeds Python, so sys.executable may be the QGIS binary; children must start a real interpreter
+    ctx = multiprocessing.get_context('spawn')
+    if not os.path.basename(sys.executable).lower().startswith('python'):
+        for name in ('pythonw.exe', 'python.exe', os.path.join('bin', 'python3')):
+            exe = os.path.join(sys.exec_prefix, name)
+            if os.path.exists(exe):
+                ctx.set_executable(exe)
+                break
+    return ProcessPoolExecutor(max_workers=workers, mp_context=ctx)
+
+
+def _line_parts(geom):
+    # geometry -> list of parts as [(x, y), ...]; None for features without a usable geometry
+    if geom is None or geom.isNull() or geom.isEmpty():
+        return None
+    lines = geom.asMultiPolyline() if geom.isMultipart() else [geom.asPolyline()]
+    return [[(p.x(), p.y()) for p in line] for line in lines]
+
+
+class FilletLinesAlgorithm(QgsProcessingAlgorithm):
+    INPUT = 'INPUT'
+    RADIUS = 'RADIUS'
+    RADIUS_FIELD = 'RADIUS_FIELD'
+    SEGS_PER_QUARTER = 'SEGS_PER_QUARTER'
+    AUTO_FIT = 'AUTO_FIT'
+    CURVES = 'CURVES'
+    CHUNK_SIZE = 'CHUNK_SIZE'
+    WORKERS = 'WORKERS'
+    OUTPUT = 'OUTPUT'
+
+    def name(self):
+        return 'filletlines'
+
+    def displayName(self):
+        return 'Fillet lines'
+
+    def group(self):
+        return 'Vector geometry'
+
+    def groupId(self):
+        return 'vectorgeometry'
+
+    def shortHelpString(self):
+        return ("Rounds every corner of the input lines with a tangent circular arc, using the same "
+                "construction as the Fillet Digitize tool. The radius is shrunk automatically where "
+                "adjacent segments are too short; with auto-fit, corners are also shrunk until the "
+                "line no longer crosses itself. A numeric field can override the radius per feature "
+                "(NULL values fall back to the fixed radius). The arcs can be written as true circular "
+                "arcs (CompoundCurve) instead of densified vertices; formats without curve support "
+                "store them densified. Features are processed in chunks on several CPU cores.")
+
+    def createInstance(self):
+        return FilletLinesAlgorithm()
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(QgsProcessingParameterFeatureSource(
+            self.INPUT, 'Input line layer', [QgsProcessing.TypeVectorLine]))
+        self.addParameter(QgsProcessingParameterDistance(
+            self.RADIUS, 'Fillet radius', 30.0, self.INPUT, minValue=0.0))
+        self.addParameter(QgsProcessingParameterField(
+            self.RADIUS_FIELD, 'Per-feature radius field', parentLayerParameterName=self.INPUT,
+            type=QgsProcessingParameterField.Numeric, optional=True))
+        self.addParameter(QgsProcessingParameterNumber(
+            self.SEGS_PER_QUARTER, 'Segments per quarter circle', QgsProcessingParameterNumber.Integer,
+            12, minValue=1))
+        self.addParameter(QgsProcessingParameterBoolean(
+            self.AUTO_FIT, 'Auto-fit radii (largest radius per corner without self-intersections)', False))
+        self.addParameter(QgsProcessingParameterBoolean(
+            self.CURVES, 'Write true arcs (CompoundCurve/MultiCurve) instead of densified vertices', False))
+
+        chunk = QgsProcessingParameterNumber(
+            self.CHUNK_SIZE, 'Features per chunk', QgsProcessingParameterNumber.Integer, 500, minValue=1)
+        workers = QgsProcessingParameterNumber(
+            self.WORKERS, 'Worker processes (0 = one per CPU core)', QgsProcessingParameterNumber.Integer,
+            0, minValue=0)
+        for param in (chunk, workers):
+            param.setFlags(param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+            self.addParameter(param)
+
+        self.addParameter(QgsProcessingParameterFeatureSink(self.OUTPUT, 'Filleted'))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        # the geometry core is only loaded once the algorithm actually runs
+        from .fillet_batch import fillet_chunk
+
+        source = self.parameterAsSource(parameters, self.INPUT, context)
+        if source is None:
+            raise QgsProcessingException(self.invalidSourceError(parameters, self.INPUT))
+        radius = self.parameterAsDouble(parameters, self.RADIUS, context)
+        field_name = self.parameterAsString(parameters, self.RADIUS_FIELD, context)
+        field_idx = source.fields().lookupField(field_name) if field_name else -1
+        segs = self.parameterAsInt(parameters, self.SEGS_PER_QUARTER, context)
+        auto_fit = self.parameterAsBoolean(parameters, self.AUTO_FIT, context)
+        curves = self.parameterAsBoolean(parameters, self.CURVES, context)
+        chunk_size = max(1, self.parameterAsInt(parameters, self.CHUNK_SIZE, context))
+        workers = self.parameterAsInt(parameters, self.WORKERS, context) or os.cpu_count() or 1
+
+        multi = QgsWkbTypes.isMultiType(source.wkbType())
+        if curves:
+            from .fillet_curves import compound_curve, multi_curve
+            wkb = QgsWkbTypes.MultiCurve if multi else QgsWkbTypes.CompoundCurve
+        else:
+            wkb = QgsWkbTypes.MultiLineString if multi else QgsWkbTypes.LineString
+        sink, dest_id = self.parameterAsSink(parameters, self.OUTPUT, context,
+                                             source.fields(), wkb, source.sourceCrs())
+        if sink is None:
+            raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
+
+        def feature_radius(feat):
+            if field_idx < 0:
+                return radius
+            try:
+                r = float(feat.attribute(field_idx))
+            except (TypeError, ValueError):
+                return radius
+            return r if r >= 0 else radius  # also rejects NaN
+
+        total = source.featureCount()
+        step = 100.0 / total if total > 0 else 0
+        written = [0]
+
+        def write(feats, results):
+            for feat, parts in zip(feats, results):
+                out = QgsFeature(feat)
+                if parts is not None and curves:
+                    out.setGeometry(QgsGeometry(multi_curve(parts) if multi else compound_curve(parts[0])))
+                elif parts is not None:
+                    lines = [[QgsPointXY(x, y) for x, y in part] for part in parts]
+                    out.setGeometry(QgsGeometry.fromMultiPolylineXY(lines) if multi
+                                    else QgsGeometry.fromPolylineXY(lines[0]))
+                sink.addFeature(out, QgsFeatureSink.FastInsert)
+            written[0] += len(feats)
+            feedback.setProgress(written[0] * step)
+
+        executor = None
+        if workers > 1:
+            try:
+                executor = _process_pool(workers)
+            except Exception as e:
+                feedback.pushInfo('Could not start worker processes ({}); running in a single process.'.format(e))
+
+        # chunks in flight: (features, payload, future); at most two per worker, so memory
+        # stays flat no matter how large the layer is
+        pending = deque()
+
+        def merge(payload, results):
+            # features without geometry are not sent to the kernel; keep them in place
+            it = iter(results)
+            return [None if parts is None else next(it) for parts, _ in payload]
+
+        def dispatch(feats):
+            payload = [(_line_parts(f.geometry()), feature_radius(f)) for f in feats]
+            jobs = [p for p in payload if p[0] is not None]
+            if executor is None:
+                write(feats, merge(payload, fillet_chunk(jobs, segs, auto_fit, curves)))
+            else:
+                pending.append((feats, payload, executor.submit(fillet_chunk, jobs, segs, auto_fit, curves)))
+
+        def drain_one():
+            feats, payload, future = pending.popleft()
+            write(feats, merge(payload, future.result()))
+
+        try:
+            chunk = []
+            for feat in source.getFeatures():
+                if feedback.isCanceled():
+                    break
+                chunk.append(feat)
+                if len(chunk) < chunk_size:
+                    continue
+                dispatch(chunk)
+                chunk = []
+                while len(pending) > 2 * workers and not feedback.isCanceled():
+                    drain_one()
+            if chunk and not feedback.isCanceled():
+                dispatch(chunk)
+            while pending and not feedback.isCanceled():
+                drain_one()
+        finally:
+            for _, _, future in pending:
+                future.cancel()
+            if executor is not None:
+                executor.shutdown(wait=True)
+
+        return {self.OUTPUT: dest_id}
+
+
+class RefilletLinesAlgorithm(QgsProcessingFeatureBasedAlgorithm):
+    """
+    Rebuilds lines from the control polygon (clicked vertices and per-corner radii) that the
+    digitizing tool stores with each feature, optionally with a new default radius or arc
+    sampling. Features whose fillet parameters do not change are passed through untouched.
+    Arcs are written as true curves when asked for or when the input layer already stores curves.
+    Supports editing the layer in place.
+    """
+    CONTROL_FIELD = 'CONTROL_FIELD'
+    RADIUS = 'RADIUS'
+    SEGS_PER_QUARTER = 'SEGS_PER_QUARTER'
+    CURVES = 'CURVES'
+
+    def name(self):
+        return 'refilletlines'
+
+    def displayName(self):
+        return 'Re-fillet lines from control polygons'
+
+    def group(self):
+        return 'Vector geometry'
+
+    def groupId(self):
+        return 'vectorgeometry'
+
+    def shortHelpString(self):
+        return ("Regenerates lines digitized with the Fillet Digitize tool from the control polygon "
+                "stored in their control field, without redigitizing. Corners that follow the default "
+                "radius get the new radius (0 keeps the stored one); corners with their own radius keep it. "
+                "Segments per quarter 0 keeps the stored sampling. The arcs can be written as true circular "
+                "arcs (CompoundCurve) instead of densified vertices; layers that already store curves always "
+                "get them. Features without a control polygon are left as they are.")
+
+    def createInstance(self):
+        return RefilletLinesAlgorithm()
+
+    def outputName(self):
+        return 'Re-filleted'
+
+    def inputLayerTypes(self):
+        return [QgsProcessing.TypeVectorLine]
+
+    def supportInPlaceEdit(self, layer):
+        from .fillet_core import DEFAULT_CONTROL_FIELD
+        return super().supportInPlaceEdit(layer) and layer.fields().lookupField(DEFAULT_CONTROL_FIELD) >= 0
+
+    def initParameters(self, config=None):
+        from .fillet_core import DEFAULT_CONTROL_FIELD
+        self.addParameter(QgsProcessingParameterString(
+            self.CONTROL_FIELD, 'Control polygon field', DEFAULT_CONTROL_FIELD))
+        self.addParameter(QgsProcessingParameterDistance(
+            self.RADIUS, 'New default radius (0 = keep stored)', 0.0, 'INPUT', minValue=0.0))
+        self.addParameter(QgsProcessingParameterNumber(
+            self.SEGS_PER_QUARTER, 'Segments per quarter circle (0 = keep stored)',
+            QgsProcessingParameterNumber.Integer, 0, minValue=0))
+        self.addParameter(QgsProcessingParameterBoolean(
+            self.CURVES, 'Write true arcs (CompoundCurve/MultiCurve) instead of densified vertices', False))
+
+    def outputWkbType(self, input_wkb_type):
+        if getattr(self, '_curves', False):
+            return QgsWkbTypes.curveType(input_wkb_type)
+        return input_wkb_type
+
+    def prepareAlgorithm(self, parameters, context, feedback):
+        self._field_name = self.parameterAsString(parameters, self.CONTROL_FIELD, context)
+        self._radius = self.parameterAsDouble(parameters, self.RADIUS, context)
+        self._segs = self.parameterAsInt(parameters, self.SEGS_PER_QUARTER, context)
+        self._curves = self.parameterAsBoolean(parameters, self.CURVES, context)
+        source = self.parameterAsSource(parameters, 'INPUT', context)
+        if source is not None and QgsWkbTypes.isCurvedType(source.wkbType()):
+            # a curved layer (also when edited in place) keeps its arcs
+            self._curves = True
+        self._field_idx = None
+        return True
+
+    def processFeature(self, feature, context, feedback):
+        # the geometry core is only loaded once the algorithm runs
+        from .fillet_core import decode_control, encode_control, fillet_curve_xy, fillet_polyline_xy, resolve_radii
+        if self._field_idx is None:
+            self._field_idx = feature.fields().lookupField(self._field_name)
+            if self._field_idx < 0:
+                raise QgsProcessingException("Field '{}' not found.".format(self._field_name))
+        try:
+            xs, ys, radii, radius, segs = decode_control(feature.attribute(self._field_idx))
+        except ValueError:
+            return [feature]
+        new_radius = self._radius or radius
+        new_segs = self._segs or segs
+        stored = feature.geometry()
+        if (new_radius == radius and new_segs == segs and not stored.isNull()
+                and QgsWkbTypes.isCurvedType(stored.wkbType()) == self._curves):
+            # nothing to recompute
+            return [feature]
+        if self._curves:
+            from .fillet_curves import compound_curve
+            geom = QgsGeometry(compound_curve(fillet_curve_xy(xs, ys, resolve_radii(radii, new_radius))))
+        else:
+            out_x, out_y = fillet_polyline_xy(xs, ys, resolve_radii(radii, new_radius), new_segs)
+            geom = QgsGeometry.fromPolylineXY([QgsPointXY(x, y) for x, y in zip(out_x, out_y)])
+        if feature.geometry().isMultipart():
+            geom.convertToMultiType()
+        out = QgsFeature(feature)
+        out.setGeometry(geom)
+        out.setAttribute(self._field_idx, encode_control(xs, ys, radii, new_radius, new_segs))
+        return [out]
+
+
+class FilletDigitizeProvider(QgsProcessingProvider):
+
+    def loadAlgorithms(self):
+        self.addAlgorithm(FilletLinesAlgorithm())
+        self.addAlgorithm(RefilletLinesAlgorithm())
+
+    def id(self):
+        return 'filletdigitize'
+
+    def name(self):
+        return 'Fillet Digitize'
+
+    def icon(self):
+        return QIcon(os.path.join(os.path.dirname(__file__), "icons", "icon.svg"))
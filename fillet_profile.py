@@ -0,0 +1,121 @@
+# fillet_profile.py
+# Optional latency instrumentation of the digitizing tool: per-stage timings, vertex counts and
+# allocated-block deltas, summarized as p50/p95/max and exportable to CSV/JSON.
+# When disabled, stage() hands out one shared no-op context, so the cost is a method call.
+
+import csv
+import json
+import sys
+import time
+from collections import deque
+
+DEFAULT_WINDOW = 1000
+
+COLUMNS = ('stage', 'count', 'p50_ms', 'p95_ms', 'max_ms', 'mean_ms', 'vertices_p50', 'vertices_max',
+           'alloc_blocks_p50', 'alloc_blocks_max')
+
+
+class _NullStage:
+    __slots__ = ('vertices',)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = ('_profiler', '_name', '_t0', '_blocks0', 'vertices')
+
+    def __init__(self, profiler, name):
+        self._profiler = profiler
+        self._name = name
+        self.vertices = None
+
+    def __enter__(self):
+        self._blocks0 = sys.getallocatedblocks()
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self._t0
+        self._profiler.record(self._name, elapsed, self.vertices, sys.getallocatedblocks() - self._blocks0)
+        return False
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))]
+
+
+class LatencyProfiler:
+    """
+    Rolling samples (the last `window` per stage) of how long each stage of the tool's event
+    handling takes. Use as `with profiler.stage('preview.tail') as st: ...; st.vertices = n`.
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.enabled = False
+        self.window = window
+        self._samples = {}  # stage -> deque of (seconds, vertices, alloc_blocks)
+
+    def stage(self, name):
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def record(self, name, seconds, vertices=None, alloc_blocks=None):
+        samples = self._samples.get(name)
+        if samples is None:
+            samples = self._samples[name] = deque(maxlen=self.window)
+        samples.append((seconds, vertices, alloc_blocks))
+
+    def reset(self):
+        self._samples.clear()
+
+    def summary(self):
+        # one row per stage, in the order the stages were first seen
+        rows = []
+        for name, samples in self._samples.items():
+            times = sorted(s[0] * 1000.0 for s in samples)
+            verts = sorted(s[1] for s in samples if s[1] is not None)
+            blocks = sorted(s[2] for s in samples if s[2] is not None)
+            rows.append({
+                'stage': name,
+                'count': len(times),
+                'p50_ms': _percentile(times, 0.5),
+                'p95_ms': _percentile(times, 0.95),
+                'max_ms': times[-1],
+                'mean_ms': sum(times) / len(times),
+                'vertices_p50': _percentile(verts, 0.5),
+                'vertices_max': verts[-1] if verts else None,
+                'alloc_blocks_p50': _percentile(blocks, 0.5),
+                'alloc_blocks_max': blocks[-1] if blocks else None,
+            })
+        return rows
+
+    def format_hud(self):
+        lines = ['{:<20} {:>5} {:>7} {:>7} {:>7} {:>7}'.format('stage', 'n', 'p50ms', 'p95ms', 'maxms', 'verts')]
+        for row in self.summary():
+            lines.append('{:<20} {:>5} {:>7.2f} {:>7.2f} {:>7.2f} {:>7}'.format(
+                row['stage'], row['count'], row['p50_ms'], row['p95_ms'], row['max_ms'],
+                '' if row['vertices_max'] is None else row['vertices_max']))
+        return '\n'.join(lines)
+
+    def export(self, path):
+        # CSV or JSON, by file extension
+        rows = self.summary()
+        if path.lower().endswith('.json'):
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'window': self.window,
+                           'stages': rows}, f, indent=2)
+        else:
+            with open(path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=COLUMNS)
+                writer.writeheader()
+                writer.writerows(rows)
@@ -0,0 +1,75 @@
+# fillet_redraw.py
+# Frame-paced redraw scheduling for the digitizing tool: bursts of mouse/key events are merged
+# so the preview is rebuilt at most once per display frame.
+
+import time
+
+from qgis.PyQt.QtCore import QObject, QTimer
+
+DEFAULT_FRAME_MS = 16
+
+
+class RedrawScheduler(QObject):
+    """
+    Latest-event-wins redraw queue. request(fn) replaces any callback still waiting, and a
+    single-shot timer runs the newest one no sooner than frame_ms after the previous run.
+    With a manual clock there is no timer: the owner runs the waiting callback with flush().
+    """
+
+    def __init__(self, parent=None, frame_ms=DEFAULT_FRAME_MS):
+        super().__init__(parent)
+        self.frame_ms = frame_ms
+        self._pending = None
+        self._last_run = None
+        self._manual = False
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.flush)
+
+    @property
+    def frame_ms(self):
+        return self._frame_ms
+
+    @frame_ms.setter
+    def frame_ms(self, value):
+        self._frame_ms = max(0, int(value))
+
+    @property
+    def pending(self):
+        return self._pending is not None
+
+    @property
+    def manual(self):
+        return self._manual
+
+    def set_manual(self, manual):
+        # manual clock (headless replay): frames run only when flush() is called
+        self._manual = manual
+        if manual:
+            self._timer.stop()
+        elif self._pending is not None:
+            self.request(self._pending)
+
+    def request(self, fn):
+        self._pending = fn
+        if self._manual or self._timer.isActive():
+            return
+        delay = 0
+        if self._last_run is not None:
+            elapsed_ms = (time.perf_counter() - self._last_run) * 1000.0
+            delay = max(0, int(round(self._frame_ms - elapsed_ms)))
+        self._timer.start(delay)
+
+    def flush(self):
+        # run the waiting callback now (also used by the timer)
+        self._timer.stop()
+        fn = self._pending
+        self._pending = None
+        if fn is None:
+            return
+        self._last_run = time.perf_counter()
+        fn()
+
+    def cancel(self):
+        self._timer.stop()
+        self._pending = None
@@ -0,0 +1,375 @@
+# fillet_replay.py
+# Record and replay of digitizing sessions, for end-to-end latency regression tests.
+# SessionRecorder keeps the input events the tool receives (mouse/keys in canvas pixels, with
+# their timing) and saves them, with the canvas view, the tool settings and the target layer's
+# features in view, as gzip'd JSON lines. replay_session() feeds such a file through a
+# FilletDigitizeTool on a headless canvas and reports per-event latency distributions plus
+# checksums of the resulting layer geometry.
+#
+#   QT_QPA_PLATFORM=offscreen python -m fillet_digitize.fillet_replay session.fsr.gz [--check]
+
+import gzip
+import hashlib
+import json
+import os
+import time
+
+from .fillet_core import DEFAULT_CONTROL_FIELD
+from .fillet_profile import LatencyProfiler
+
+SESSION_FORMAT = 'fillet-session/1'
+SESSION_SUFFIX = '.fsr.gz'
+# features of the target layer stored with a recording (those in view, at most)
+DEFAULT_MAX_FEATURES = 20000
+# how long replay waits for a background check of a finished line
+VALIDATION_TIMEOUT_S = 30.0
+
+PRESS = 'press'
+MOVE = 'move'
+RELEASE = 'release'
+DOUBLE_CLICK = 'double'
+KEY = 'key'
+# timing of the preview rebuilds the replayer runs between events
+FRAME = 'frame'
+
+
+def _crs_definition(crs):
+    return crs.authid() or 'WKT:' + crs.toWkt()
+
+
+class SessionRecorder:
+    """
+    Input events of one tool session. The tool calls mouse()/key() at the top of its event
+    handlers while `tool.recorder` is set; times are milliseconds since start().
+    """
+
+    def __init__(self, tool, max_features=DEFAULT_MAX_FEATURES):
+        self.tool = tool
+        self.max_features = max_features
+        self.header = None
+        self.events = []
+        self._t0 = None
+
+    def start(self):
+        self.header = self._capture()
+        self.events = []
+        self._t0 = time.perf_counter()
+
+    def _ms(self):
+        return round((time.perf_counter() - self._t0) * 1000.0, 2)
+
+    def mouse(self, kind, event):
+        pos = event.pos()
+        self.events.append([self._ms(), kind, pos.x(), pos.y(), int(event.button()), int(event.buttons()),
+                            int(event.modifiers())])
+
+    def key(self, event):
+        self.events.append([self._ms(), KEY, event.key(), int(event.modifiers()), event.text()])
+
+    def _capture(self):
+        # everything replay needs to rebuild the view, the tool and the layer it digitizes into
+        from qgis.core import QgsFeatureRequest, QgsWkbTypes
+        tool = self.tool
+        canvas = tool.canvas
+        extent = canvas.extent()
+        layer = tool.layer
+        ctl_idx = layer.fields().lookupField(tool.control_field)
+        request = QgsFeatureRequest()
+        if tool.crs.canvas_to_layer is not None:
+            request.setFilterRect(tool.crs.canvas_to_layer.transformBoundingBox(extent))
+        else:
+            request.setFilterRect(extent)
+        if ctl_idx < 0:
+            request.setNoAttributes()
+        features = []
+        for feat in layer.getFeatures(request):
+            if len(features) >= self.max_features:
+                break
+            ctl = feat.attribute(ctl_idx) if ctl_idx >= 0 else None
+            features.append([feat.geometry().asWkt(), ctl if isinstance(ctl, str) else None])
+        sketch = []
+        for i in range(len(tool.sketch)):
+            pt = tool.crs.to_canvas(*tool.sketch.point(i))
+            sketch.append([pt.x(), pt.y(), tool.sketch.radius(i)])
+        return {
+            'format': SESSION_FORMAT,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'canvas': {
+                'width': canvas.width(),
+                'height': canvas.height(),
+                'extent': [extent.xMinimum(), extent.yMinimum(), extent.xMaximum(), extent.yMaximum()],
+                'map_units_per_pixel': canvas.mapUnitsPerPixel(),
+                'crs': _crs_definition(tool.crs.canvas_crs()),
+            },
+            'layer': {
+                'crs': _crs_definition(layer.crs()),
+                'geometry': QgsWkbTypes.displayString(QgsWkbTypes.flatType(layer.wkbType())),
+                'control_field': tool.control_field if ctl_idx >= 0 else None,
+                'feature_count': layer.featureCount(),
+                'features': features,
+            },
+            'tool': {
+                'radius': tool.radius,
+                'segs': tool.segs,
+                'frame_ms': tool.frame_ms,
+                'preview_tolerance_px': tool.preview_tolerance_px,
+                'next_point_radius': tool.next_point_radius,
+                'auto_fit': tool.auto_fit,
+                'stream_mode': tool.stream_mode,
+                'stream_tolerance_px': tool.stream_tolerance_px,
+                'curve_output': tool.curve_output,
+                'edge_offset': tool.edge_offset,
+                'edge_offsets': list(tool.edge_offsets),
+                'work_crs': tool.work_crs,
+                'snap': tool.snapper.enabled,
+                'snap_tolerance_px': tool.snapper.tolerance_px,
+                'check_layer_crossings': tool.check_layer_crossings,
+                'sketch': sketch,
+            },
+        }
+
+    def save(self, path):
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            f.write(json.dumps(self.header, separators=(',', ':')) + '\n')
+            for ev in self.events:
+                f.write(json.dumps(ev, separators=(',', ':')) + '\n')
+        return path
+
+
+def load_session(path):
+    # -> (header, events)
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        header = json.loads(f.readline())
+        if header.get('format') != SESSION_FORMAT:
+            raise ValueError('{}: not a fillet session recording'.format(path))
+        events = [json.loads(line) for line in f if line.strip()]
+    return header, events
+
+
+def layer_checksums(layer, control_field=DEFAULT_CONTROL_FIELD):
+    """
+    sha256 of every feature's geometry (WKT, 6 decimals) and control polygon, sorted, and a
+    combined sha256 of those: independent of feature ids and write order.
+    """
+    ctl_idx = layer.fields().lookupField(control_field)
+    digests = []
+    for feat in layer.getFeatures():
+        text = feat.geometry().asWkt(6)
+        if ctl_idx >= 0:
+            ctl = feat.attribute(ctl_idx)
+            text += '|' + (ctl if isinstance(ctl, str) else '')
+        digests.append(hashlib.sha256(text.encode('utf-8')).hexdigest())
+    digests.sort()
+    combined = hashlib.sha256(''.join(digests).encode('ascii')).hexdigest()
+    return combined, digests
+
+
+def _build_layer(info):
+    from qgis.core import QgsCoordinateReferenceSystem, QgsFeature, QgsGeometry, QgsVectorLayer
+    uri = info['geometry']
+    if info['control_field']:
+        uri += '?field={}:string'.format(info['control_field'])
+    layer = QgsVectorLayer(uri, 'replay', 'memory')
+    layer.setCrs(QgsCoordinateReferenceSystem(info['crs']))
+    feats = []
+    for wkt, ctl in info['features']:
+        feat = QgsFeature(layer.fields())
+        feat.setGeometry(QgsGeometry.fromWkt(wkt))
+        if info['control_field']:
+            feat.setAttribute(0, ctl)
+        feats.append(feat)
+    layer.dataProvider().addFeatures(feats)
+    layer.startEditing()
+    return layer
+
+
+def _build_canvas(info):
+    from qgis.core import QgsApplication, QgsCoordinateReferenceSystem, QgsRectangle
+    from qgis.gui import QgsMapCanvas
+    canvas = QgsMapCanvas()
+    canvas.resize(info['width'], info['height'])
+    canvas.show()
+    # the map settings pick up the widget size from the resize event
+    QgsApplication.processEvents()
+    canvas.setDestinationCrs(QgsCoordinateReferenceSystem(info['crs']))
+    canvas.setExtent(QgsRectangle(*info['extent']))
+    return canvas
+
+
+def _build_tool(canvas, layer, settings):
+    from qgis.core import QgsPointXY
+    from .fillet_tool import FilletDigitizeTool
+    tool = FilletDigitizeTool(canvas, layer, settings['radius'], settings['segs'], settings['frame_ms'])
+    # message boxes would block a headless run
+    tool.messages = []
+    # frames run from replay_session only, never from the redraw timer inside processEvents()
+    tool._redraw.set_manual(True)
+    tool.preview_tolerance_px = settings['preview_tolerance_px']
+    tool.auto_fit = settings['auto_fit']
+    tool.stream_mode = settings['stream_mode']
+    tool.stream_tolerance_px = settings['stream_tolerance_px']
+    # settings newer than the recording keep the tool's defaults
+    tool.curve_output = settings.get('curve_output', False)
+    tool.edge_offset = settings.get('edge_offset', tool.edge_offset)
+    tool.edge_offsets = tuple(settings.get('edge_offsets', ()))
+    tool.check_layer_crossings = settings['check_layer_crossings']
+    tool.snapper.enabled = settings['snap']
+    tool.snapper.tolerance_px = settings['snap_tolerance_px']
+    tool.work_crs = settings['work_crs']
+    canvas.setMapTool(tool)
+    for i, (x, y, r) in enumerate(settings['sketch']):
+        pt = QgsPointXY(x, y)
+        if i == 0:
+            tool.crs.set_local_origin(pt)
+        tool.append_point(tool.crs.to_work(pt), r)
+    if settings['sketch']:
+        tool._show_sketch()
+    tool.next_point_radius = settings['next_point_radius']
+    return tool
+
+
+def _make_event(canvas, ev):
+    from qgis.PyQt.QtCore import QEvent, QPoint, Qt
+    from qgis.PyQt.QtGui import QKeyEvent
+    from qgis.gui import QgsMapMouseEvent
+    kind = ev[1]
+    if kind == KEY:
+        _, _, key, modifiers, text = ev
+        return QKeyEvent(QEvent.KeyPress, key, Qt.KeyboardModifiers(modifiers), text)
+    _, _, x, y, button, buttons, modifiers = ev
+    qtype = {PRESS: QEvent.MouseButtonPress, MOVE: QEvent.MouseMove, RELEASE: QEvent.MouseButtonRelease,
+             DOUBLE_CLICK: QEvent.MouseButtonDblClick}[kind]
+    return QgsMapMouseEvent(canvas, qtype, QPoint(x, y), Qt.MouseButton(button), Qt.MouseButtons(buttons),
+                            Qt.KeyboardModifiers(modifiers))
+
+
+def _wait_for_finish(tool):
+    # a finished line checked in the background is written when the result arrives; that wait
+    # is part of the latency the user sees
+    from qgis.core import QgsApplication
+    deadline = time.perf_counter() + VALIDATION_TIMEOUT_S
+    while tool._finishing() and time.perf_counter() < deadline:
+        QgsApplication.processEvents()
+        time.sleep(0.0005)
+
+
+def replay_session(path, profile_stages=False):
+    """
+    Replay a recording through a FilletDigitizeTool on a headless canvas; needs an initialized
+    QgsApplication. Events are dispatched back to back while the redraw frames follow the
+    recorded timeline (a pending preview rebuild runs once frame_ms of recorded time passed;
+    the tool's redraw timer is switched off, so every frame is timed), so results do not
+    depend on the speed of the machine.
+    Returns a dict with the per-event-kind latency summary ('events', LatencyProfiler rows),
+    the tool's own stage summary ('stages', with profile_stages), the layer checksums and
+    the messages the tool would have shown.
+    """
+    from qgis.core import QgsApplication
+    header, events = load_session(path)
+    canvas = _build_canvas(header['canvas'])
+    layer = _build_layer(header['layer'])
+    tool = _build_tool(canvas, layer, header['tool'])
+    tool.set_profiling(profile_stages)
+    redraw = tool._redraw
+    handlers = {PRESS: tool.canvasPressEvent, MOVE: tool.canvasMoveEvent, RELEASE: tool.canvasReleaseEvent,
+                DOUBLE_CLICK: tool.canvasDoubleClickEvent, KEY: tool.keyPressEvent}
+    latency = LatencyProfiler(window=max(1, len(events)))
+    last_frame = None
+
+    def run_frame():
+        t0 = time.perf_counter()
+        redraw.flush()
+        latency.record(FRAME, time.perf_counter() - t0, len(tool.sketch))
+
+    for ev in events:
+        t = ev[0]
+        if redraw.pending and (last_frame is None or t - last_frame >= tool.frame_ms):
+            run_frame()
+            last_frame = t
+        qevent = _make_event(canvas, ev)
+        handler = handlers[ev[1]]
+        t0 = time.perf_counter()
+        handler(qevent)
+        if tool._finishing():
+            _wait_for_finish(tool)
+        latency.record(ev[1], time.perf_counter() - t0, len(tool.sketch))
+        # queued signals (background preview checks) are delivered between events
+        QgsApplication.processEvents()
+    if redraw.pending:
+        run_frame()
+    stages = tool.profiler.summary() if profile_stages else []
+    canvas.unsetMapTool(tool)  # deactivate(): ends a stroke, flushes the writer
+    checksum, feature_checksums = layer_checksums(layer, header['layer']['control_field'] or DEFAULT_CONTROL_FIELD)
+    result = {
+        'session': os.path.basename(path),
+        'events': latency.summary(),
+        'stages': stages,
+        'event_count': len(events),
+        'feature_count': layer.featureCount(),
+        'checksum': checksum,
+        'feature_checksums': feature_checksums,
+        'map_units_per_pixel': [header['canvas']['map_units_per_pixel'], canvas.mapUnitsPerPixel()],
+        'messages': list(tool.messages),
+    }
+    layer.rollBack()
+    canvas.deleteLater()
+    return result
+
+
+def expected_path(path):
+    # sidecar file holding the checksum a recording is expected to produce
+    base = path[:-len(SESSION_SUFFIX)] if path.endswith(SESSION_SUFFIX) else path
+    return base + '.expected.json'
+
+
+def _format_rows(rows):
+    lines = ['  {:<24} {:>6} {:>8} {:>8} {:>8}'.format('event', 'n', 'p50ms', 'p95ms', 'maxms')]
+    for row in rows:
+        lines.append('  {:<24} {:>6} {:>8.3f} {:>8.3f} {:>8.3f}'.format(
+            row['stage'], row['count'], row['p50_ms'], row['p95_ms'], row['max_ms']))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    import argparse
+    import sys
+    parser = argparse.ArgumentParser(description='Replay recorded fillet digitizing sessions headlessly.')
+    parser.add_argument('sessions', nargs='+', help='session recordings (*{})'.format(SESSION_SUFFIX))
+    parser.add_argument('--stages', action='store_true', help="also report the tool's per-stage timings")
+    parser.add_argument('--json', help='write all results to this JSON file')
+    parser.add_argument('--check', action='store_true', help='compare checksums with the .expected.json files')
+    parser.add_argument('--update', action='store_true', help='write the checksums to the .expected.json files')
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from qgis.core import QgsApplication
+    app = QgsApplication([], True)
+    app.initQgis()
+    results = []
+    failed = 0
+    try:
+        for path in args.sessions:
+            result = replay_session(path, args.stages)
+            results.append(result)
+            print('{}: {} events, {} features, checksum {}'.format(
+                result['session'], result['event_count'], result['feature_count'], result['checksum'][:16]))
+            print(_format_rows(result['events'] + result['stages']))
+            expected = expected_path(path)
+            if args.update:
+                with open(expected, 'w', encoding='utf-8') as f:
+                    json.dump({'checksum': result['checksum'], 'feature_count': result['feature_count']}, f, indent=2)
+            elif args.check and os.path.exists(expected):
+                with open(expected, encoding='utf-8') as f:
+                    want = json.load(f)['checksum']
+                if want != result['checksum']:
+                    print('  CHECKSUM MISMATCH: expected {}'.format(want[:16]))
+                    failed += 1
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump({'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results}, f, indent=2)
+    finally:
+        app.exitQgis()
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
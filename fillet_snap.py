@@ -0,0 +1,271 @@
+# fillet_snap.py
+# Vertex/segment snapping for the digitizing tool. Each snap layer gets its own spatial index
+# (with stored geometries), built once and then kept current from the layer's edit signals,
+# so a lookup only touches the few features next to the cursor. The target layer's index is
+# also used for the crossing check against existing features (fillet_conflicts).
+# Lookups are made in the map CRS; layers in another CRS are queried through a transform.
+
+import time
+
+from qgis.PyQt.QtCore import QObject, pyqtSignal
+from qgis.core import (
+    QgsCoordinateTransform, QgsCsException, QgsFeature, QgsFeatureRequest, QgsPointXY, QgsProject,
+    QgsSpatialIndex
+)
+
+DEFAULT_TOLERANCE_PX = 12
+DEFAULT_BUDGET_MS = 4.0
+# nearest features looked at per lookup
+DEFAULT_CANDIDATES = 8
+
+SNAP_VERTEX = 'vertex'
+SNAP_SEGMENT = 'segment'
+# placeholder ids of lines still queued for the layer, far below the temporary ids of new features
+PENDING_ID_BASE = -(1 << 60)
+
+
+class SnapMatch:
+    __slots__ = ('point', 'kind', 'layer', 'fid')
+
+    def __init__(self, point, kind, layer, fid):
+        self.point = point
+        self.kind = kind
+        self.layer = layer
+        self.fid = fid
+
+
+class LayerSnapIndex(QObject):
+    """
+    Spatial index of one layer's geometries. build() scans the layer once; afterwards added,
+    deleted and reshaped features (including uncommitted edits and their commit/rollback) are
+    applied one by one from the layer's signals. Lines still waiting in the tool's feature writer
+    are indexed too (add_pending), until the layer has them (drop_pending). `deleted` is emitted
+    (with the index) when the layer is about to be deleted.
+    """
+    deleted = pyqtSignal(object)
+
+    def __init__(self, layer, parent=None):
+        super().__init__(parent)
+        self.layer = layer
+        self._index = None
+        self._temp_ids = set()  # uncommitted (negative) feature ids currently in the index
+        self._pending = []  # placeholder ids of queued lines, see add_pending
+        self._pending_seq = 0
+        self.revision = 0  # bumped on every change, for results derived from the index
+        self._from_map = None  # map CRS -> layer CRS transform, None when they are the same
+
+    @property
+    def built(self):
+        return self._index is not None
+
+    def build(self):
+        request = QgsFeatureRequest().setNoAttributes()
+        self._index = QgsSpatialIndex(self.layer.getFeatures(request), None,
+                                      QgsSpatialIndex.FlagStoreFeatureGeometries)
+        buf = self.layer.editBuffer()
+        self._temp_ids = set(buf.addedFeatures().keys()) if buf is not None else set()
+        self.layer.featureAdded.connect(self._on_feature_added)
+        self.layer.featureDeleted.connect(self._on_feature_deleted)
+        self.layer.geometryChanged.connect(self._on_geometry_changed)
+        self.layer.committedFeaturesAdded.connect(self._on_committed_features_added)
+        self.layer.willBeDeleted.connect(self._on_layer_deleted)
+
+    def close(self):
+        if self._index is None:
+            return
+        try:
+            self.layer.featureAdded.disconnect(self._on_feature_added)
+            self.layer.featureDeleted.disconnect(self._on_feature_deleted)
+            self.layer.geometryChanged.disconnect(self._on_geometry_changed)
+            self.layer.committedFeaturesAdded.disconnect(self._on_committed_features_added)
+            self.layer.willBeDeleted.disconnect(self._on_layer_deleted)
+        except (TypeError, RuntimeError):
+            pass
+        self._index = None
+        self._temp_ids.clear()
+        self._pending = []
+
+    def _insert(self, fid, geom):
+        if geom is None or geom.isEmpty():
+            return
+        feat = QgsFeature(fid)
+        feat.setGeometry(geom)
+        self._index.addFeature(feat)
+        self.revision += 1
+        if fid < 0:
+            self._temp_ids.add(fid)
+
+    def _remove(self, fid):
+        geom = self._index.geometry(fid)
+        if geom.isEmpty():
+            return
+        feat = QgsFeature(fid)
+        feat.setGeometry(geom)
+        self._index.deleteFeature(feat)
+        self.revision += 1
+        self._temp_ids.discard(fid)
+
+    def add_pending(self, geom):
+        # a line queued for the layer (layer CRS): snappable and checked against from now on;
+        # returns its placeholder id (None when not indexed)
+        if self._index is None or geom is None or geom.isEmpty():
+            return None
+        fid = PENDING_ID_BASE - self._pending_seq
+        self._pending_seq += 1
+        feat = QgsFeature(fid)
+        feat.setGeometry(geom)
+        self._index.addFeature(feat)
+        self._pending.append(fid)
+        self.revision += 1
+        return fid
+
+    def drop_pending(self, fids=None):
+        # the queued lines (all, or the placeholder ids fids) were written or given up; written ones
+        # were indexed under their real ids by the layer's own signals
+        if self._index is None:
+            return
+        drop = set(self._pending) if fids is None else set(fids)
+        for fid in drop:
+            self._remove(fid)
+        self._pending = [fid for fid in self._pending if fid not in drop]
+
+    def _on_layer_deleted(self):
+        self.deleted.emit(self)
+
+    def _on_feature_added(self, fid):
+        feat = self.layer.getFeature(fid)
+        self._insert(fid, feat.geometry())
+
+    def _on_feature_deleted(self, fid):
+        self._remove(fid)
+
+    def _on_geometry_changed(self, fid, geom):
+        self._remove(fid)
+        self._insert(fid, geom)
+
+    def _on_committed_features_added(self, layer_id, features):
+        # committing replaces the temporary ids of new features by their provider ids
+        for fid in list(self._temp_ids):
+            self._remove(fid)
+        for feat in features:
+            self._insert(feat.id(), feat.geometry())
+
+    def set_map_crs(self, crs):
+        layer_crs = self.layer.crs()
+        if crs is None or not crs.isValid() or crs == layer_crs:
+            self._from_map = None
+        else:
+            self._from_map = QgsCoordinateTransform(crs, layer_crs, QgsProject.instance().transformContext())
+
+    def from_map(self, pt, tolerance):
+        # map point and tolerance -> (point, tolerance) in layer coordinates
+        if self._from_map is None:
+            return pt, tolerance
+        p = self._from_map.transform(pt)
+        q = self._from_map.transform(QgsPointXY(pt.x() + tolerance, pt.y()))
+        return p, p.distance(q)
+
+    def to_map(self, pt):
+        if self._from_map is None:
+            return QgsPointXY(pt)
+        return self._from_map.transform(QgsPointXY(pt), QgsCoordinateTransform.ReverseTransform)
+
+    def nearest(self, pt, tolerance, count=DEFAULT_CANDIDATES):
+        # ids of up to `count` features within `tolerance` of pt, nearest first
+        return self._index.nearestNeighbor(pt, count, tolerance)
+
+    def intersecting(self, rect):
+        # ids of features whose bounding box meets rect
+        return self._index.intersects(rect)
+
+    def geometry(self, fid):
+        return self._index.geometry(fid)
+
+
+class FilletSnapper:
+    """
+    Snaps map points to the vertices (preferred) and segments of a set of layers.
+    Points are in map coordinates (set_map_crs). A lookup stops early once budget_ms is spent,
+    keeping the best match found so far, so it can run on every preview frame.
+    """
+
+    def __init__(self, tolerance_px=DEFAULT_TOLERANCE_PX, budget_ms=DEFAULT_BUDGET_MS):
+        self.tolerance_px = tolerance_px
+        self.budget_ms = budget_ms
+        self.enabled = True
+        self._indexes = []
+        self._map_crs = None
+
+    @property
+    def layers(self):
+        return [idx.layer for idx in self._indexes]
+
+    def set_layers(self, layers):
+        # indexes of layers that stay in the set are kept; new layers are indexed now
+        keep = {id(idx.layer): idx for idx in self._indexes}
+        indexes = []
+        for layer in layers:
+            if layer is None or any(i.layer is layer for i in indexes):
+                continue
+            idx = keep.pop(id(layer), None)
+            if idx is None:
+                idx = LayerSnapIndex(layer)
+                idx.build()
+                idx.set_map_crs(self._map_crs)
+                idx.deleted.connect(self._drop)
+            indexes.append(idx)
+        for idx in keep.values():
+            idx.close()
+        self._indexes = indexes
+
+    def set_map_crs(self, crs):
+        self._map_crs = crs
+        for idx in self._indexes:
+            idx.set_map_crs(crs)
+
+    def index_for(self, layer):
+        for idx in self._indexes:
+            if idx.layer is layer:
+                return idx
+        return None
+
+    def _drop(self, idx):
+        # the index's layer is being deleted
+        idx.close()
+        if idx in self._indexes:
+            self._indexes.remove(idx)
+
+    def clear(self):
+        self.set_layers([])
+
+    def snap(self, pt, map_units_per_pixel):
+        if not self.enabled or not self._indexes:
+            return None
+        tol = self.tolerance_px * map_units_per_pixel
+        deadline = time.perf_counter() + self.budget_ms / 1000.0
+        best_vertex = None  # (sqr_dist in map units, SnapMatch)
+        best_segment = None
+        for idx in self._indexes:
+            try:
+                lpt, ltol = idx.from_map(pt, tol)
+            except QgsCsException:
+                continue
+            # squared layer distances -> squared map distances
+            to_map2 = (tol / ltol) ** 2 if ltol > 0 else 1.0
+            for fid in idx.nearest(lpt, ltol):
+                geom = idx.geometry(fid)
+                vertex, at, _, _, d2 = geom.closestVertex(lpt)
+                d2 *= to_map2
+                if at >= 0 and d2 <= tol * tol and (best_vertex is None or d2 < best_vertex[0]):
+                    best_vertex = (d2, SnapMatch(idx.to_map(vertex), SNAP_VERTEX, idx.layer, fid))
+                if best_vertex is None:
+                    d2, seg_pt, after, _ = geom.closestSegmentWithContext(lpt)
+                    d2 *= to_map2
+                    if after > 0 and 0 <= d2 <= tol * tol and (best_segment is None or d2 < best_segment[0]):
+                        best_segment = (d2, SnapMatch(idx.to_map(seg_pt), SNAP_SEGMENT, idx.layer, fid))
+                if time.perf_counter() > deadline:
+                    break
+            if time.perf_counter() > deadline:
+                break
+        best = best_vertex or best_segment
+        return best[1] if best is not None else None
@@ -0,0 +1,89 @@
+# fillet_stream.py
+# Online vertex decimation for the freehand (stream) digitizing mode. Raw mouse positions are
+# thinned as they arrive, so only the corners that survive reach the fillet engine; memory and
+# the work per mouse event are bounded by the window size, however long the stroke.
+
+DEFAULT_TOLERANCE_PX = 2.0
+# raw points kept between two settled vertices at most
+DEFAULT_WINDOW = 64
+
+
+def _segment_dist2(px, py, ax, ay, bx, by):
+    # squared distance of P from segment AB
+    dx, dy = bx - ax, by - ay
+    l2 = dx*dx + dy*dy
+    if l2 == 0:
+        return (px - ax)**2 + (py - ay)**2
+    t = max(0.0, min(1.0, ((px - ax)*dx + (py - ay)*dy) / l2))
+    return (px - ax - t*dx)**2 + (py - ay - t*dy)**2
+
+
+class StreamDecimator:
+    """
+    Douglas-Peucker run online. Raw points since the last settled vertex (the anchor) are kept
+    while they all stay within `tolerance` of the chord from the anchor to the newest point;
+    when one strays, the point farthest from that chord is settled as a vertex and becomes the
+    anchor, as in one Douglas-Peucker split. Points closer than the tolerance to the previous
+    one are dropped on arrival, and a full window settles a vertex early.
+    """
+
+    def __init__(self, tolerance, window=DEFAULT_WINDOW):
+        self.tolerance = tolerance
+        self.window = max(2, window)
+        self._anchor = None
+        self._pending = []  # raw points after the anchor, newest last
+
+    @property
+    def active(self):
+        return self._anchor is not None
+
+    def start(self, x, y):
+        self._anchor = (x, y)
+        self._pending = []
+
+    def push(self, x, y):
+        # add a raw point; returns the vertices it settled (usually none), oldest first
+        if self._anchor is None:
+            self.start(x, y)
+            return []
+        tol2 = self.tolerance * self.tolerance
+        lx, ly = self._pending[-1] if self._pending else self._anchor
+        if (x - lx)**2 + (y - ly)**2 < tol2:
+            return []
+        self._pending.append((x, y))
+        settled = []
+        while True:
+            split = self._split(tol2)
+            if split is None:
+                break
+            self._anchor = self._pending[split]
+            settled.append(self._anchor)
+            del self._pending[:split + 1]
+        if len(self._pending) >= self.window:
+            self._anchor = self._pending[-2]
+            settled.append(self._anchor)
+            del self._pending[:-1]
+        return settled
+
+    def _split(self, tol2):
+        # index of the pending point farthest from the anchor -> newest chord, if beyond tolerance
+        if len(self._pending) < 2:
+            return None
+        ax, ay = self._anchor
+        bx, by = self._pending[-1]
+        worst, split = tol2, None
+        for i in range(len(self._pending) - 1):
+            px, py = self._pending[i]
+            d2 = _segment_dist2(px, py, ax, ay, bx, by)
+            if d2 > worst:
+                worst, split = d2, i
+        return split
+
+    def finish(self, x=None, y=None):
+        # end the stroke (at (x, y) when given); returns the remaining vertices including its end
+        settled = self.push(x, y) if x is not None else []
+        if self._pending:
+            settled.append(self._pending[-1])
+        self._anchor = None
+        self._pending = []
+        return settled
@@ -5,277 +5,645 @@ from qgis.PyQt.QtGui import QColor, QFont
 from qgis.gui import QgsMapTool, QgsRubberBand
 from qgis.core import (
     QgsPointXY, QgsGeometry, QgsFeature, QgsProject,
-    QgsWkbTypes, QgsVectorLayer
+    QgsWkbTypes, QgsVectorLayer, QgsLineString, QgsMultiLineString, QgsCoordinateTransform
 )
-from qgis.PyQt.QtWidgets import QLabel, QMessageBox
 import math
+from qgis.PyQt.QtWidgets import QLabel, QMessageBox, QFileDialog
+from array import array
 
-# --- 你的所有辅助函数 ---
-def unit(vx, vy):
-    L = math.hypot(vx, vy)
-    return (vx / L, vy / L) if L > 0 else (0.0, 0.0)
-
-def dot(a, b):
-    return a[0]*b[0] + a[1]*b[1]
-
-def normalize_angle(a):
-    while a <= -math.pi:
-        a += 2*math.pi
-    while a > math.pi:
-        a -= 2*math.pi
-    return a
-
-# --- new: robust segment intersection checks to detect self-crossings in preview/final geometry ---
-def _orient(ax, ay, bx, by, cx, cy):
-    return (bx-ax)*(cy-ay) - (by-ay)*(cx-ax)
-
-def _on_segment(ax, ay, bx, by, cx, cy):
-    # check if point C(cx,cy) is on segment AB
-    return min(ax, bx) - 1e-9 <= cx <= max(ax, bx) + 1e-9 and min(ay, by) - 1e-9 <= cy <= max(ay, by) + 1e-9
-
-def _segments_intersect(p1, p2, p3, p4):
-    ax, ay = p1.x(), p1.y()
-    bx, by = p2.x(), p2.y()
-    cx, cy = p3.x(), p3.y()
-    dx, dy = p4.x(), p4.y()
-    o1 = _orient(ax, ay, bx, by, cx, cy)
-    o2 = _orient(ax, ay, bx, by, dx, dy)
-    o3 = _orient(cx, cy, dx, dy, ax, ay)
-    o4 = _orient(cx, cy, dx, dy, bx, by)
-
-    if (o1 > 0 and o2 < 0 or o1 < 0 and o2 > 0) and (o3 > 0 and o4 < 0 or o3 < 0 and o4 > 0):
-        return True
-    # special colinear cases
-    if abs(o1) <= 1e-9 and _on_segment(ax, ay, bx, by, cx, cy):
-        return True
-    if abs(o2) <= 1e-9 and _on_segment(ax, ay, bx, by, dx, dy):
-        return True
-    if abs(o3) <= 1e-9 and _on_segment(cx, cy, dx, dy, ax, ay):
-        return True
-    if abs(o4) <= 1e-9 and _on_segment(cx, cy, dx, dy, bx, by):
-        return True
-    return False
+from .fillet_redraw import RedrawScheduler, DEFAULT_FRAME_MS
+from .fillet_history import SketchHistory, AddPoint, SetCornerRadius, DEFAULT_HISTORY_DEPTH
+from .fillet_writer import BufferedFeatureWriter
+from .fillet_snap import FilletSnapper, SNAP_VERTEX
+from .fillet_conflicts import layer_conflicts
+from .fillet_profile import LatencyProfiler
+from .fillet_validate import FilletValidator, check_line, BACKGROUND_MIN_VERTICES
+from .fillet_stream import StreamDecimator, DEFAULT_TOLERANCE_PX as DEFAULT_STREAM_TOLERANCE_PX
+from .fillet_crs import ToolCrs, WORK_CRS_MODES, transform_xy
+from .fillet_replay import SessionRecorder, PRESS, MOVE, RELEASE, DOUBLE_CLICK
+from .fillet_curves import compound_curve, supports_curves
+from .fillet_core import (
+    Sketch, FilletPreviewCache, append_fillet, append_unique, fillet_polyline_xy,
+    encode_control, decode_control, DEFAULT_CONTROL_FIELD, max_tangent_radii, fit_radii, refit_corners,
+    fillet_curve_xy,
+    offset_point, append_offset_corner, offset_polyline_xy
+)
 
-def polyline_self_intersects(pts):
-    # detect intersection between any two non-adjacent segments of open polyline pts
-    n = len(pts)
-    if n < 4:
-        return False
-    # segments: (0,1), (1,2), ..., (n-2,n-1)
-    for i in range(0, n-1):
-        a1 = pts[i]
-        a2 = pts[i+1]
-        for j in range(i+2, n-1):
-            # skip adjacent segments that share a vertex
-            # for open polyline, i and j are non-adjacent if j > i+1
-            # also skip the case where first and last segment share endpoint (not a closed ring)
-            if i == 0 and j == n-2:
-                # these are not adjacent for an open polyline, keep checking
-                pass
-            if _segments_intersect(a1, a2, pts[j], pts[j+1]):
-                return True
-    return False
-
-def fillet_three_points(p_prev, p, p_next, radius, segs_per_quarter=4):
-    # ... [你的原函数内容不变] ...
-    v1 = (p_prev.x() - p.x(), p_prev.y() - p.y())
-    v2 = (p_next.x() - p.x(), p_next.y() - p.y())
-    l1 = math.hypot(v1[0], v1[1])
-    l2 = math.hypot(v2[0], v2[1])
-    if l1 == 0 or l2 == 0:
-        return [QgsPointXY(p)]
-    s1 = (v1[0]/l1, v1[1]/l1)
-    s2 = (v2[0]/l2, v2[1]/l2)
-    cos_alpha = max(-1.0, min(1.0, dot(s1, s2)))
-    alpha = math.acos(cos_alpha)
-    if alpha < 1e-6 or abs(math.pi - alpha) < 1e-6:
-        return [QgsPointXY(p)]
-    t = radius / math.tan(alpha / 2.0)
-    t_max = min(l1, l2)
-    if t > t_max:
-        t = t_max
-        radius_local = t * math.tan(alpha / 2.0)
-        if radius_local <= 0:
-            return [QgsPointXY(p)]
-        radius = radius_local
-    T1 = QgsPointXY(p.x() + s1[0] * t, p.y() + s1[1] * t)
-    T2 = QgsPointXY(p.x() + s2[0] * t, p.y() + s2[1] * t)
-    bis = (s1[0] + s2[0], s1[1] + s2[1])
-    bis_len = math.hypot(bis[0], bis[1])
-    if bis_len == 0:
-        return [QgsPointXY(p)]
-    bis_u = (bis[0]/bis_len, bis[1]/bis_len)
-    h = radius / math.sin(alpha / 2.0)
-    Cx = p.x() + bis_u[0] * h
-    Cy = p.y() + bis_u[1] * h
-    a1 = math.atan2(T1.y() - Cy, T1.x() - Cx)
-    a2 = math.atan2(T2.y() - Cy, T2.x() - Cx)
-    d = normalize_angle(a2 - a1)
-    segs = max(1, int(math.ceil(abs(d) / (math.pi/2) * segs_per_quarter)))
-    pts = [T1]
-    for k in range(1, segs):
-        theta = a1 + d * (k / segs)
-        x = Cx + radius * math.cos(theta)
-        y = Cy + radius * math.sin(theta)
-        pts.append(QgsPointXY(x, y))
-    pts.append(T2)
-    return pts
 
 # --- 主工具类 ---
 class FilletDigitizeTool(QgsMapTool):
-    def __init__(self, canvas, line_layer, radius=10.0, segs_per_quarter=6):
+    def __init__(self, canvas, line_layer, radius=10.0, segs_per_quarter=6, frame_ms=DEFAULT_FRAME_MS,
+                 history_depth=DEFAULT_HISTORY_DEPTH):
         super().__init__(canvas)
         self.canvas = canvas
+        # vertex/segment snapping to self.layer plus snap_layers; indexes are built on activation
+        self.snapper = FilletSnapper()
+        self._snap_layers = []
+        self._snap_match = None
+        # clicks are in the canvas CRS, lines are written in the layer CRS; fillets are computed in
+        # the working CRS (work_crs: 'canvas', 'layer' or 'local' metric), sketch coordinates included
+        self.crs = ToolCrs(canvas, self)
+        # finished lines are queued and written to the layer in batches
+        self._writer = BufferedFeatureWriter(parent=self)
+        self._writer.flushed.connect(self._on_features_flushed)
+        self._queued = []   # (feature, layer, snap index, placeholder id) in the writer's queue order
+        self._unsaved = []  # (geometry, layer) of lines the layer refused; kept on the pending band
         self.layer = line_layer
         self.radius = float(radius)           # global default radius
-        self.segs = segs_per_quarter
+        self.segs = segs_per_quarter          # arc sampling of the stored geometry
+        # the live preview samples arcs by on-screen chord error instead (pixels; None -> use self.segs)
+        self.preview_tolerance_px = 0.5
         self.setCursor(Qt.CrossCursor)
 
+        # bands are split into a static part (placed points / cached fillets, redrawn only when
+        # the sketch changes) and a small dynamic part that follows the mouse
         self.perm_rb = QgsRubberBand(self.canvas, QgsWkbTypes.LineGeometry)
         self.perm_rb.setColor(QColor(50, 150, 255, 200))
         self.perm_rb.setWidth(5)
+        # guiding segment from the last placed point to the mouse
+        self.guide_rb = QgsRubberBand(self.canvas, QgsWkbTypes.LineGeometry)
+        self.guide_rb.setColor(QColor(50, 150, 255, 200))
+        self.guide_rb.setWidth(5)
 
-        self.preview_rb = QgsRubberBand(self.canvas, QgsWkbTypes.LineGeometry)
         # normal preview color: green; bad preview: red
         self.preview_color_ok = QColor(0, 200, 0, 200)
         self.preview_color_bad = QColor(255, 0, 0, 200)
+        # long lines are validated in the background; amber until the result arrives
+        self.preview_color_pending = QColor(255, 190, 0, 200)
+        # filleted committed corners (the preview cache prefix)
+        self.prefix_rb = QgsRubberBand(self.canvas, QgsWkbTypes.LineGeometry)
+        self.prefix_rb.setColor(self.preview_color_ok)
+        self.prefix_rb.setWidth(2)
+        self._prefix_shown = None  # cache revision prefix_rb was drawn from
+        self._preview_color = self.preview_color_ok
+        # tail fillet following the mouse
+        self.preview_rb = QgsRubberBand(self.canvas, QgsWkbTypes.LineGeometry)
         self.preview_rb.setColor(self.preview_color_ok)
         self.preview_rb.setWidth(2)
 
+        # edge lines at edge_offsets: cached prefix (static) and the part following the mouse
+        self.edge_prefix_rb = QgsRubberBand(self.canvas, QgsWkbTypes.LineGeometry)
+        self.edge_prefix_rb.setColor(QColor(0, 150, 120, 200))
+        self.edge_prefix_rb.setWidth(1)
+        self.edge_prefix_rb.setLineStyle(Qt.DashLine)
+        self._edges_shown = None  # cache revision edge_prefix_rb was drawn from
+        self.edge_rb = QgsRubberBand(self.canvas, QgsWkbTypes.LineGeometry)
+        self.edge_rb.setColor(QColor(0, 150, 120, 200))
+        self.edge_rb.setWidth(1)
+        self.edge_rb.setLineStyle(Qt.DashLine)
+
+        # finished lines still waiting in the feature writer
+        self.pending_rb = QgsRubberBand(self.canvas, QgsWkbTypes.LineGeometry)
+        self.pending_rb.setColor(QColor(50, 150, 255, 200))
+        self.pending_rb.setWidth(2)
+
+        # markers at the points where the preview crosses itself
+        self.cross_rb = QgsRubberBand(self.canvas, QgsWkbTypes.PointGeometry)
+        self.cross_rb.setColor(self.preview_color_bad)
+        self.cross_rb.setIcon(QgsRubberBand.ICON_X)
+        self.cross_rb.setIconSize(12)
+        self.cross_rb.setWidth(3)
+
+        # snapped vertex (box) or segment (circle) under the cursor
+        self.snap_rb = QgsRubberBand(self.canvas, QgsWkbTypes.PointGeometry)
+        self.snap_rb.setColor(QColor(255, 0, 255, 220))
+        self.snap_rb.setIconSize(12)
+        self.snap_rb.setWidth(2)
+
+        # existing features of the layer that the preview/final line would cross
+        self.conflict_rb = QgsRubberBand(self.canvas, QgsWkbTypes.LineGeometry)
+        self.conflict_rb.setColor(QColor(255, 120, 0, 220))
+        self.conflict_rb.setWidth(4)
+
         self.radius_label = QLabel(self.canvas)
         self.radius_label.setWindowFlags(self.radius_label.windowFlags() | Qt.ToolTip)
         self.radius_label.setStyleSheet("background: rgba(0,0,0,180); color: white; padding:4px; border-radius:4px;")
         self.radius_label.setFont(QFont("Sans", 9))
         self.radius_label.hide()
 
-        self.points = []
-        # per-point radii, same length as self.points; value None -> use global self.radius
-        self._radii = []
+        # optional per-stage latency instrumentation, shown next to radius_label (P toggles, Shift+P exports)
+        self.profiler = LatencyProfiler()
+        self.perf_label = QLabel(self.canvas)
+        self.perf_label.setWindowFlags(self.perf_label.windowFlags() | Qt.ToolTip)
+        self.perf_label.setStyleSheet("background: rgba(0,0,0,180); color: #9f9; padding:4px; border-radius:4px;")
+        self.perf_label.setFont(QFont("Monospace", 8))
+        self.perf_label.hide()
+
+        # placed vertices and per-corner radii (None/NaN -> use global self.radius), as plain floats
+        self.sketch = Sketch()
 
         # next_point_radius: temporary override for the last-placed point (will be committed when next point is clicked)
         self.next_point_radius = None
 
         self.last_mouse_pt = None
+        self._raw_mouse_pt = None
         self.last_global_pos = None
         self._radius_step = 1.0
 
-        # undo/redo stacks: store tuples (points_snapshot, radii_snapshot, next_point_radius_snapshot)
-        self._undo_stack = []
-        self._redo_stack = []
+        # undo/redo history of point/corner-radius operations (O(1) per step, at most history_depth steps)
+        self._history = SketchHistory(history_depth)
 
         # state of last preview validity
         self._last_preview_invalid = False
+        self._validating = False
+
+        # background self-intersection checks; _validation is (kind, job, payload) of the job
+        # whose result the tool is waiting for ('preview' or 'finish')
+        self.validator = FilletValidator(self)
+        self.validator.validated.connect(self._on_validated)
+        self._validation = None
+
+        # clicked vertices and radii are stored with each line in this text field (when the layer has it);
+        # E then picks such a line to re-fillet it (edit fillet mode), Enter writes it back
+        self.control_field = DEFAULT_CONTROL_FIELD
+        self._picking = False
+        self._editing_fid = None
+        self._edit_restore = None  # (radius, segs) to restore after re-filleting
+
+        # also reject lines that cross existing features of the target layer
+        self.check_layer_crossings = True
+        self._prefix_conflicts = (None, [])  # ((cache, index) revisions, conflicting fids of the prefix)
+        self._shown_conflicts = ([], None)
+
+        # auto-fit (A): each corner gets the largest radius up to its own that keeps the line simple;
+        # _fit holds the fitted radii of the preview corners, _sketch_fit the placed part's (by sketch revision)
+        # and _sketch_refit the placed part's bisected radii: (key, (x, y, radius) of the placed points
+        # they were fitted for, radii, corners the bisection could not fix)
+        self.auto_fit = False
+        self._fit = []
+        self._sketch_fit = (None, [])
+        self._sketch_refit = (None, [], [], frozenset())
+
+        # freehand stream mode (F): press and drag to trace; the raw mouse stream is decimated online
+        # (tolerance in pixels) and only the surviving vertices are added, as one undo step per stroke
+        self.stream_mode = False
+        self.stream_tolerance_px = DEFAULT_STREAM_TOLERANCE_PX
+        self._stream = StreamDecimator(0.0)
+        self._stream_ops = None  # (ops, next_point_radius before) of the stroke in progress
+        self._sketch_dirty = False  # perm_rb is redrawn on the next frame
+
+        # edge lines (O): parallel lines at these signed offsets (left of the digitizing direction
+        # positive) made of arcs concentric with the centreline's fillets, previewed live and written
+        # to the layer together with each new centreline; O toggles them at +/- edge_offset
+        self.edge_offsets = ()
+        self.edge_offset = 5.0
+
+        # curve output (C): finished lines are written as straight parts plus one circular arc per
+        # corner (CompoundCurve) to layers that store curves; other layers get densified lines
+        self.curve_output = False
+
+        # filleted arcs of the committed corners, reused across mouse moves
+        self._preview_cache = FilletPreviewCache()
+
+        # mouse-move/key bursts are merged into at most one preview rebuild per frame_ms
+        self._redraw = RedrawScheduler(self, frame_ms)
+
+        self.crs.changed.connect(self._on_crs_changed)
+
+        # R records the session's input events (SessionRecorder) for replay in latency regression tests
+        self.recorder = None
+        # set to a list to collect the warnings instead of showing message boxes (headless replay)
+        self.messages = None
+
+    def activate(self):
+        super().activate()
+        # transforms are built once here and rebuilt on CRS-change signals only
+        self.crs.attach(self.layer)
+        self._update_snap_index()
 
     def canvasPressEvent(self, event):
-        pt_map = self.toMapCoordinates(event.pos())
-        self.last_mouse_pt = QgsPointXY(pt_map)
-        self.last_global_pos = self.canvas.mapToGlobal(event.pos())
-        if event.button() == Qt.LeftButton:
-            # push current snapshot for undo (deep copies), then clear redo stack (new action)
-            pts_snap = [QgsPointXY(p) for p in self.points]
-            radii_snap = [r for r in self._radii]
-            next_snap = None if self.next_point_radius is None else float(self.next_point_radius)
-            self._undo_stack.append((pts_snap, radii_snap, next_snap))
-            self._redo_stack.clear()
-
-            # If we have at least one existing point, and a temporary next_point_radius set,
-            # commit that radius to the last point (the corner to be filleted once the new point is placed).
-            if len(self.points) >= 1 and self.next_point_radius is not None:
-                # ensure radii list is aligned
-                while len(self._radii) < len(self.points):
-                    self._radii.append(None)
-                self._radii[-1] = float(self.next_point_radius)
-                # reset temporary override after committing
-                self.next_point_radius = None
+        if self.recorder is not None:
+            self.recorder.mouse(PRESS, event)
+        if self._finishing():
+            # clicking again keeps the sketch open
+            self._cancel_validation()
+        if self._picking and event.button() == Qt.LeftButton:
+            self._picking = False
+            self._pick_control_feature(self._snapped_map_point(event.pos()))
+            return
+        with self.profiler.stage('press'):
+            pt_map = self._snapped_map_point(event.pos())
+            self.last_mouse_pt = QgsPointXY(pt_map)
+            self.last_global_pos = self.canvas.mapToGlobal(event.pos())
+            if event.button() == Qt.LeftButton:
+                next_before = self.next_point_radius
+                ops = []
+                if len(self.sketch) == 0:
+                    # a local metric working CRS is centred on the first vertex of each line
+                    self.crs.set_local_origin(pt_map)
+                wx, wy = self.crs.to_work(pt_map)
 
-            # append new point and align radii
-            self.points.append(QgsPointXY(pt_map))
-            self._radii.append(None)
+                # If we have at least one existing point, and a temporary next_point_radius set,
+                # commit that radius to the last point (the corner to be filleted once the new point is placed).
+                if len(self.sketch) >= 1 and self.next_point_radius is not None:
+                    idx = len(self.sketch) - 1
+                    ops.append(SetCornerRadius(idx, self.sketch.radius(idx), float(self.next_point_radius)))
+                    # reset temporary override after committing
+                    self.next_point_radius = None
 
-            self.perm_rb.reset(QgsWkbTypes.LineGeometry)
-            for p in self.points:
-                self.perm_rb.addPoint(p, False)
-            self.perm_rb.show()
-            self._update_preview(self.last_mouse_pt)
-            self._update_radius_label()
+                # append new point with its own (global) radius
+                ops.append(AddPoint((wx, wy)))
+                for op in ops:
+                    op.apply(self)
+                if self.stream_mode:
+                    # the stroke's vertices join this step when the button is released
+                    self._start_stroke(wx, wy, ops, next_before)
+                else:
+                    # record the step for undo (a new action clears redo)
+                    self._history.record(ops, next_before)
+
+                self._show_sketch()
+                self._update_preview(self.last_mouse_pt)
+                self._update_radius_label()
+        self._update_perf_hud()
 
     def canvasMoveEvent(self, event):
-        pt_map = self.toMapCoordinates(event.pos())
-        self.last_mouse_pt = QgsPointXY(pt_map)
+        if self.recorder is not None:
+            self.recorder.mouse(MOVE, event)
+        # snapping runs once per frame, on the latest position only
+        self._raw_mouse_pt = QgsPointXY(self.toMapCoordinates(event.pos()))
         self.last_global_pos = self.canvas.mapToGlobal(event.pos())
-        # keep the guiding (blue) rubber band visible while moving:
-        # show permanent points plus a guiding line from last point to current mouse position
-        self.perm_rb.reset(QgsWkbTypes.LineGeometry)
-        if len(self.points) > 0:
-            for p in self.points:
-                self.perm_rb.addPoint(p, False)
-            # add guiding segment to current mouse position
-            self.perm_rb.addPoint(QgsPointXY(pt_map), True)
-        self.perm_rb.show()
+        if self._stream.active:
+            with self.profiler.stage('stream.push'):
+                self._add_stream_vertices(self._stream.push(*self.crs.to_work(self._raw_mouse_pt)))
+        # only the latest position matters; the redraw happens on the next frame
+        self._redraw.request(self._redraw_frame)
+
+    def _redraw_frame(self):
+        prof = self.profiler
+        with prof.stage('frame'):
+            if self._raw_mouse_pt is not None:
+                if self._stream.active:
+                    # a stroke follows the raw pointer; only its ends are snapped
+                    self.last_mouse_pt = self._raw_mouse_pt
+                else:
+                    with prof.stage('frame.snap'):
+                        self.last_mouse_pt = self._snap(self._raw_mouse_pt)
+                self._raw_mouse_pt = None
+            if self._sketch_dirty:
+                self._show_sketch()
+            # guiding (blue) segment from the last placed point to the mouse; the placed points
+            # themselves stay in perm_rb, which only changes with the sketch
+            with prof.stage('frame.guide') as st:
+                self._update_guide()
+                st.vertices = 2
+            if self.last_mouse_pt is not None:
+                self._update_preview(self.last_mouse_pt)
+            with prof.stage('frame.label'):
+                self._update_radius_label()
+        self._update_perf_hud()
+
+    def canvasReleaseEvent(self, event):
+        if self.recorder is not None:
+            self.recorder.mouse(RELEASE, event)
+        if self._stream.active and event.button() == Qt.LeftButton:
+            self.last_global_pos = self.canvas.mapToGlobal(event.pos())
+            self._end_stroke(self._snapped_map_point(event.pos()))
+
+    # --- freehand stream mode ---
+    def _start_stroke(self, x, y, ops, next_before):
+        # (x, y): first point of the stroke, in the working CRS
+        try:
+            mupp = self.canvas.mapUnitsPerPixel()
+        except Exception:
+            mupp = 0.0
+        self._stream.tolerance = self.stream_tolerance_px * (mupp or 0.0) * self.crs.work_per_canvas
+        self._stream.start(x, y)
+        self._stream_ops = (ops, next_before)
+
+    def _add_stream_vertices(self, vertices):
+        # vertices settled by the decimator become sketch points of the stroke in progress
+        if not vertices:
+            return
+        ops = self._stream_ops[0]
+        for x, y in vertices:
+            op = AddPoint((x, y))
+            op.apply(self)
+            ops.append(op)
+        self._sketch_dirty = True
+        self._redraw.request(self._redraw_frame)
+
+    def _end_stroke(self, pt=None):
+        # settle the rest of the stroke (ending at pt when given) and record it as one undo step
+        ops, next_before = self._stream_ops
+        self._stream_ops = None
+        end = self._stream.finish(*self.crs.to_work(pt)) if pt is not None else self._stream.finish()
+        for x, y in end:
+            op = AddPoint((x, y))
+            op.apply(self)
+            ops.append(op)
+        self._history.record(ops, next_before)
+        self._show_sketch()
         self._update_preview(self.last_mouse_pt)
         self._update_radius_label()
 
+    @property
+    def frame_ms(self):
+        return self._redraw.frame_ms
+
+    @frame_ms.setter
+    def frame_ms(self, value):
+        self._redraw.frame_ms = value
+
     def canvasDoubleClickEvent(self, event):
-        if len(self.points) >= 1:
-            pt = self.toMapCoordinates(event.pos())
+        if self.recorder is not None:
+            self.recorder.mouse(DOUBLE_CLICK, event)
+        if len(self.sketch) >= 1:
+            pt = self._snapped_map_point(event.pos())
             # before finalizing, if the user had set a temporary next_point_radius, commit it to the last point
-            if len(self.points) >= 1 and self.next_point_radius is not None:
-                while len(self._radii) < len(self.points):
-                    self._radii.append(None)
-                self._radii[-1] = float(self.next_point_radius)
+            if self.next_point_radius is not None:
+                self.set_corner_radius(len(self.sketch) - 1, float(self.next_point_radius))
                 # do not need to keep next_point_radius after commit
                 self.next_point_radius = None
 
-            pts_final = self.points + [QgsPointXY(pt)]
-            # build radii_for_final aligned with pts_final
-            radii_for_final = [None] * len(pts_final)
-            for i in range(len(self._radii)):
-                if i < len(radii_for_final):
-                    radii_for_final[i] = self._radii[i]
-            # the appended final point keeps None
+            prof = self.profiler
+            with prof.stage('finish'):
+                self._finish_line(pt, prof)
+            self._update_perf_hud()
 
-            if len(pts_final) < 2:
-                return
-            if len(pts_final) == 2:
-                final_geom = QgsGeometry.fromPolylineXY(pts_final)
-                # two-point straight segment cannot self-intersect
-                valid = True
+    def _reset_sketch(self):
+        # the finished line was queued (or the edit abandoned): start over with an empty sketch
+        if self._edit_restore is not None:
+            self.radius, self.segs = self._edit_restore
+        self._editing_fid = None
+        self._edit_restore = None
+        self.next_point_radius = None
+        self.sketch.clear()
+        self._preview_cache.clear()
+        self._fit = []
+        self._redraw.cancel()
+        self.perm_rb.reset(QgsWkbTypes.LineGeometry)
+        self.guide_rb.reset(QgsWkbTypes.LineGeometry)
+        self._set_band_line(self.prefix_rb, (), ())
+        self.preview_rb.reset(QgsWkbTypes.LineGeometry)
+        self._set_band_lines(self.edge_prefix_rb, ())
+        self._set_band_lines(self.edge_rb, ())
+        self.cross_rb.reset(QgsWkbTypes.PointGeometry)
+        self._show_conflicts([])
+        self._show_snap(None)
+        self.radius_label.hide()
+        # clear undo/redo after finishing shape
+        self._history.clear()
+
+    def _finish_line(self, pt, prof):
+        """
+        Build the finished line and validate it. Returns True when it was queued for writing,
+        False when it was rejected and None while a long line is still validated in the background
+        (_on_validated completes it; any further edit of the sketch cancels that).
+        pt is the double-clicked end point, or None to finish with the placed points only (Enter).
+        """
+        # final vertices: placed points plus the double-clicked one (which keeps the global radius)
+        xs = array('d', self.sketch.xs)
+        ys = array('d', self.sketch.ys)
+        own_radii = array('d', self.sketch.radii)
+        if pt is not None:
+            x, y = self.crs.to_work(pt)
+            xs.append(x)
+            ys.append(y)
+            own_radii.append(math.nan)
+        if len(xs) < 2:
+            return False
+        radii = [self.radius if math.isnan(r) else r for r in own_radii]
+        if self.auto_fit and len(xs) > 2:
+            with prof.stage('finish.fit'):
+                fitted = fit_radii(xs, ys, radii, self.segs)
+            # corners the fit shrank keep their fitted radius when the line is re-filleted
+            for i, r in enumerate(fitted):
+                if r < radii[i]:
+                    own_radii[i] = r
+            radii = fitted
+        # the control polygon is stored in layer coordinates and units, like the line itself, so that
+        # re-filleting it (edit mode, Processing) does not depend on the working CRS it was drawn in
+        cxs, cys = transform_xy(self.crs.work_to_layer, xs, ys)
+        k = self.crs.layer_per_work(xs[0], ys[0])
+        control = encode_control(cxs, cys, [r * k for r in own_radii], self.radius * k, self.segs)
+
+        curves = self._writes_curves()
+        edges = self._edge_geometries(xs, ys, radii, curves)
+        if len(xs) == 2:
+            final_geom = QgsGeometry.fromPolylineXY(self._to_qgs_points(xs, ys))
+            # two-point straight segment cannot self-intersect
+            return self._complete_line(xs, ys, final_geom, control, [], True, edges)
+
+        with prof.stage('finish.build') as st:
+            if curves:
+                final_geom = QgsGeometry(compound_curve(fillet_curve_xy(xs, ys, radii)))
+            # the densified line is still what the self-intersection and layer checks look at
+            xs, ys = fillet_polyline_xy(xs, ys, radii, self.segs)
+            if not curves:
+                final_geom = QgsGeometry.fromPolylineXY(self._to_qgs_points(xs, ys))
+            st.vertices = len(xs)
+        if len(xs) >= BACKGROUND_MIN_VERTICES:
+            self._validation = ('finish', self.validator.submit(xs, ys), (xs, ys, final_geom, control, edges))
+            self._set_band_line(self.prefix_rb, (), ())
+            self._set_band_line(self.preview_rb, xs, ys)
+            self._set_preview_state(None, [])
+            self._update_radius_label()
+            return None
+        self._cancel_validation()
+        # robust self-intersection test (detect crossing arcs/segments)
+        with prof.stage('finish.self_check') as st:
+            st.vertices = len(xs)
+            crossings, valid = check_line(xs, ys)
+        return self._complete_line(xs, ys, final_geom, control, crossings, valid, edges)
+
+    def _writes_curves(self):
+        return self.curve_output and supports_curves(self.layer)
+
+    def _edge_geometries(self, xs, ys, radii, curves):
+        # edge lines of a new centreline, from the same corners and radii (edits rewrite the centreline only),
+        # as (densified xs, ys for the checks, geometry to write)
+        if not self.edge_offsets or self._editing_fid is not None:
+            return []
+        edges = []
+        for offset in self.edge_offsets:
+            exs, eys = offset_polyline_xy(xs, ys, radii, offset, self.segs)
+            if curves:
+                geom = QgsGeometry(compound_curve(fillet_curve_xy(xs, ys, radii, offset)))
             else:
-                new_pts = self._build_filleted_points(pts_final, radii_for_pts=radii_for_final)
-                final_geom = QgsGeometry.fromPolylineXY(new_pts)
-                # robust self-intersection test (detect crossing arcs/segments)
-                try:
-                    valid = not polyline_self_intersects(new_pts)
-                except Exception:
-                    # fallback: try GEOS validity if available
-                    try:
-                        valid = final_geom.isGeosValid()
-                    except Exception:
-                        valid = True
-
-            if not valid:
-                QMessageBox.warning(None, "Fillet warning",
-                                    "The calculated fillet would create a self-intersecting or invalid polyline.\n"
-                                    "Reduce the radius and try again.")
-                return
+                geom = QgsGeometry.fromPolylineXY(self._to_qgs_points(exs, eys))
+            edges.append((exs, eys, geom))
+        return edges
+
+    def _complete_line(self, xs, ys, final_geom, control, crossings, valid, edges=()):
+        # second half of finishing, once the self-intersection result is known
+        prof = self.profiler
+        self._show_crossings(crossings)
+        if not valid:
+            self._set_preview_state(False, [])
+            self._notify("Fillet warning",
+                         "The calculated fillet would create a self-intersecting or invalid polyline.\n"
+                         "Reduce the radius and try again.")
+            return False
+
+        with prof.stage('finish.layer_check') as st:
+            st.vertices = len(xs)
+            conflicts = self._layer_conflicts(xs, ys)
+            self._show_conflicts(conflicts)
+        if conflicts:
+            self._set_preview_state(True, conflicts)
+            self._notify("Fillet warning",
+                         "The calculated fillet would cross {} existing feature(s) of the layer.\n"
+                         "Adjust the line or the radius and try again.".format(len(conflicts)))
+            return False
+        if edges and not self._check_edges(edges):
+            return False
 
-            if self.layer.isEditable() or (self.layer.dataProvider().capabilities() & self.layer.dataProvider().AddFeatures):
+        if self.crs.work_to_layer is not None:
+            # all densified vertices in one call
+            final_geom.transform(self.crs.work_to_layer)
+        if QgsWkbTypes.isMultiType(self.layer.wkbType()):
+            final_geom.convertToMultiType()
+        control_idx = self.layer.fields().lookupField(self.control_field)
+        with prof.stage('finish.write'):
+            if self._editing_fid is not None:
+                if not self._rewrite_feature(self._editing_fid, final_geom, control_idx, control):
+                    return False
+            elif self.layer.isEditable() or (self.layer.dataProvider().capabilities() & self.layer.dataProvider().AddFeatures):
                 feat = QgsFeature(self.layer.fields())
                 feat.setGeometry(final_geom)
-                res, feats = self.layer.dataProvider().addFeatures([feat])
-                if res:
-                    self.layer.triggerRepaint()
-            self.points = []
-            self._radii = []
-            self.perm_rb.reset(QgsWkbTypes.LineGeometry)
-            self.preview_rb.reset(QgsWkbTypes.LineGeometry)
-            self.radius_label.hide()
-            # clear undo/redo after finishing shape
-            self._undo_stack.clear()
-            self._redo_stack.clear()
+                if control_idx >= 0:
+                    feat.setAttribute(control_idx, control)
+                self._queue_feature(feat)
+                for _, _, geom in edges:
+                    # edge lines go in alongside, without a control polygon of their own
+                    if self.crs.work_to_layer is not None:
+                        geom.transform(self.crs.work_to_layer)
+                    if QgsWkbTypes.isMultiType(self.layer.wkbType()):
+                        geom.convertToMultiType()
+                    edge = QgsFeature(self.layer.fields())
+                    edge.setGeometry(geom)
+                    self._queue_feature(edge)
+        self._reset_sketch()
+        return True
+
+    def _check_edges(self, edges):
+        # the edge lines are held to the centreline's rules: no self-intersections, no crossings
+        # with existing features of the layer
+        prof = self.profiler
+        with prof.stage('finish.edge_check') as st:
+            st.vertices = sum(len(exs) for exs, _, _ in edges)
+            for exs, eys, _ in edges:
+                crossings, valid = check_line(exs, eys)
+                if not valid:
+                    self._show_crossings(crossings)
+                    self._set_preview_state(False, [])
+                    self._notify("Fillet warning",
+                                 "An edge line would cross itself at this offset.\n"
+                                 "Reduce the offset or change the radius and try again.")
+                    return False
+            conflicts = []
+            for exs, eys, _ in edges:
+                conflicts += [fid for fid in self._layer_conflicts(exs, eys) if fid not in conflicts]
+        if conflicts:
+            self._show_conflicts(conflicts)
+            self._set_preview_state(True, conflicts)
+            self._notify("Fillet warning",
+                         "The edge lines would cross {} existing feature(s) of the layer.\n"
+                         "Adjust the line or the offset and try again.".format(len(conflicts)))
+            return False
+        return True
+
+    def _rewrite_feature(self, fid, geom, control_idx, control):
+        # edit fillet mode: replace the picked feature's geometry (and control polygon) in place
+        layer = self.layer
+        if not layer.isEditable():
+            self._notify("Fillet warning", "The layer must be in edit mode to re-fillet a line.")
+            return False
+        layer.beginEditCommand("Re-fillet line")
+        ok = layer.changeGeometry(fid, geom)
+        if ok and control_idx >= 0:
+            ok = layer.changeAttributeValue(fid, control_idx, control)
+        if ok:
+            layer.endEditCommand()
+            layer.triggerRepaint()
+        else:
+            layer.destroyEditCommand()
+            self._notify("Fillet warning", "The re-filleted line could not be written to the layer.")
+        return ok
+
+    def _pick_control_feature(self, pt):
+        # edit fillet mode: load the clicked vertices and radii stored with the nearest line
+        index = self.snapper.index_for(self.layer)
+        field_idx = self.layer.fields().lookupField(self.control_field)
+        if index is None or field_idx < 0:
+            self._notify("Edit fillet",
+                         "The layer has no '{}' field with stored control polygons.".format(self.control_field),
+                         warning=False)
+            return False
+        pt, tol = index.from_map(pt, self.snapper.tolerance_px * self.canvas.mapUnitsPerPixel())
+        for fid in index.nearest(pt, tol):
+            try:
+                control = decode_control(self.layer.getFeature(fid).attribute(field_idx))
+            except ValueError:
+                continue
+            self._load_control(fid, *control)
+            return True
+        self._notify("Edit fillet", "No line with a stored control polygon at this position.", warning=False)
+        return False
+
+    def _load_control(self, fid, xs, ys, radii, default_radius, segs):
+        self._reset_sketch()
+        self._edit_restore = (self.radius, self.segs)
+        self._editing_fid = fid
+        self.segs = segs
+        if len(xs) > 0 and self.crs.canvas_to_layer is not None:
+            self.crs.set_local_origin(self.crs.canvas_to_layer.transform(
+                QgsPointXY(xs[0], ys[0]), QgsCoordinateTransform.ReverseTransform))
+        elif len(xs) > 0:
+            self.crs.set_local_origin(QgsPointXY(xs[0], ys[0]))
+        xs, ys = transform_xy(self.crs.layer_to_work, xs, ys)
+        # radii are stored in layer units (see _finish_line)
+        k = self.crs.layer_per_work(xs[0], ys[0]) if len(xs) > 0 else 1.0
+        self.radius = default_radius / k
+        for x, y, r in zip(xs, ys, radii):
+            self.sketch.append(x, y, None if math.isnan(r) else r / k)
+        self._show_sketch()
+        self._update_preview(self.last_mouse_pt)
+        self._update_radius_label()
+
+    def _finishing(self):
+        return self._validation is not None and self._validation[0] == 'finish'
+
+    def _cancel_validation(self):
+        if self._validation is not None:
+            self.validator.cancel()
+            self._validation = None
+        self._validating = False
+
+    def _on_validated(self, job, crossings, valid, seconds):
+        # result of a background check; anything but the job the tool waits for is outdated
+        if self._validation is None or self._validation[1] != job:
+            return
+        kind, _, payload = self._validation
+        self._validation = None
+        self._validating = False
+        if self.profiler.enabled:
+            self.profiler.record(kind + '.background_check', seconds)
+        if kind == 'preview':
+            self._show_crossings(crossings)
+            self._set_preview_state(valid, payload)
+            self._update_radius_label()
+        else:
+            xs, ys, final_geom, control, edges = payload
+            self._complete_line(xs, ys, final_geom, control, crossings, valid, edges)
+        self._update_perf_hud()
 
     def keyPressEvent(self, event):
         k = event.key()
+        # R starts/stops recording; it and the HUD keys (P) are not part of the recording
+        if k == Qt.Key_R and not event.modifiers() & Qt.ControlModifier:
+            self.toggle_recording()
+            event.accept()
+            return
+        if self.recorder is not None and k != Qt.Key_P:
+            self.recorder.key(event)
+        if self._stream.active:
+            # keys act on a settled sketch: close the stroke in progress first
+            self._end_stroke()
+        if self._finishing() and k not in (Qt.Key_P, Qt.Key_S, Qt.Key_Return, Qt.Key_Enter):
+            # editing while the finished line is still being validated keeps the sketch open
+            self._cancel_validation()
         changed = False
         if k in (Qt.Key_Plus, Qt.Key_Equal):
             self.radius += self._radius_step
@@ -290,18 +658,21 @@ class FilletDigitizeTool(QgsMapTool):
             self.radius = max(0.0, self.radius - self._radius_step * 10.0)
             changed = True
 
+        if changed:
+            self._invalidate_global_radius()
+
         # Per-corner temporary radius adjustments for the next corner (last placed point)
         # '.' increases, ',' decreases. Only affects next_point_radius, not global self.radius.
         if k == Qt.Key_Period or k == Qt.Key_Greater:
             # ensure there is a last placed point to modify
-            if len(self.points) >= 1:
+            if len(self.sketch) >= 1:
                 if self.next_point_radius is None:
                     # start from global default
                     self.next_point_radius = float(self.radius)
                 self.next_point_radius = float(self.next_point_radius + self._radius_step)
                 changed = True
         elif k == Qt.Key_Comma or k == Qt.Key_Less:
-            if len(self.points) >= 1:
+            if len(self.sketch) >= 1:
                 if self.next_point_radius is None:
                     self.next_point_radius = float(self.radius)
                 self.next_point_radius = max(0.0, float(self.next_point_radius - self._radius_step))
@@ -309,203 +680,706 @@ class FilletDigitizeTool(QgsMapTool):
 
         # Backspace as undo of last change / point addition
         if k == Qt.Key_Backspace:
-            if self._undo_stack:
+            if self._history.can_undo():
                 self._do_undo()
                 event.accept()
                 return
-            elif len(self.points) > 0:
-                # fallback: remove last point and push snapshot to redo (keep radii aligned)
-                prev_pts = [QgsPointXY(p) for p in self.points]
-                prev_radii = [r for r in self._radii]
-                next_snap = None if self.next_point_radius is None else float(self.next_point_radius)
-                self._redo_stack.append((prev_pts, prev_radii, next_snap))
-
-                self.points.pop()
-                if len(self._radii) > 0:
-                    self._radii.pop()
+            elif len(self.sketch) > 0:
+                # fallback: remove last point and let redo put it back
+                op = AddPoint(self.sketch.point(-1), self.sketch.radius(-1))
+                op.revert(self)
+                self._history.record_redo([op], self.next_point_radius)
                 # reset temporary next corner radius since the last point changed
                 self.next_point_radius = None
 
-                self.perm_rb.reset(QgsWkbTypes.LineGeometry)
-                for p in self.points:
-                    self.perm_rb.addPoint(p, False)
+                self._show_sketch()
                 self._update_preview(self.last_mouse_pt if self.last_mouse_pt else None)
                 self._update_radius_label()
                 event.accept()
                 return
 
+        # P toggles the performance HUD (and the instrumentation behind it), Shift+P exports it
+        if k == Qt.Key_P and not event.modifiers() & Qt.ControlModifier:
+            if event.modifiers() & Qt.ShiftModifier:
+                self.export_performance()
+            else:
+                self.set_profiling(not self.profiler.enabled)
+            event.accept()
+            return
+
+        # E picks a line to re-fillet (edit fillet mode), Enter finishes without adding a point,
+        # Esc abandons the re-fillet
+        if k == Qt.Key_E and not event.modifiers() & Qt.ControlModifier:
+            self._picking = len(self.sketch) == 0 and not self._picking
+            event.accept()
+            return
+        if k in (Qt.Key_Return, Qt.Key_Enter) and len(self.sketch) >= 2:
+            with self.profiler.stage('finish'):
+                self._finish_line(None, self.profiler)
+            self._update_perf_hud()
+            event.accept()
+            return
+        if k == Qt.Key_Escape and (self._editing_fid is not None or self._picking):
+            self._picking = False
+            self._reset_sketch()
+            event.accept()
+            return
+
+        # A toggles auto-fit of the corner radii
+        if k == Qt.Key_A and not event.modifiers() & Qt.ControlModifier:
+            self.set_auto_fit(not self.auto_fit)
+            self._redraw.request(self._redraw_frame)
+            event.accept()
+            return
+
+        # M cycles the working CRS of the fillets: canvas, layer, local metric
+        if k == Qt.Key_M and not event.modifiers() & Qt.ControlModifier:
+            self.work_crs = WORK_CRS_MODES[(WORK_CRS_MODES.index(self.work_crs) + 1) % len(WORK_CRS_MODES)]
+            self._update_radius_label()
+            event.accept()
+            return
+
+        # C toggles true-arc (curve) output
+        if k == Qt.Key_C and not event.modifiers() & Qt.ControlModifier:
+            self.curve_output = not self.curve_output
+            self._update_radius_label()
+            event.accept()
+            return
+
+        # O toggles the edge lines; { and } change their distance from the centreline
+        if k == Qt.Key_O and not event.modifiers() & Qt.ControlModifier:
+            self.set_edge_offsets(() if self.edge_offsets else (self.edge_offset, -self.edge_offset))
+            self._update_radius_label()
+            event.accept()
+            return
+        if k in (Qt.Key_BraceLeft, Qt.Key_BraceRight):
+            step = self._radius_step if k == Qt.Key_BraceRight else -self._radius_step
+            self.edge_offset = max(self._radius_step, self.edge_offset + step)
+            if self.edge_offsets:
+                self.set_edge_offsets((self.edge_offset, -self.edge_offset))
+            self._update_radius_label()
+            event.accept()
+            return
+
+        # F toggles the freehand stream mode
+        if k == Qt.Key_F and not event.modifiers() & Qt.ControlModifier:
+            self.stream_mode = not self.stream_mode
+            self._update_radius_label()
+            event.accept()
+            return
+
+        # S toggles snapping to existing vertices/segments
+        if k == Qt.Key_S and not event.modifiers() & Qt.ControlModifier:
+            self.snapper.enabled = not self.snapper.enabled
+            if not self.snapper.enabled:
+                self._show_snap(None)
+            event.accept()
+            return
+
         # Ctrl+Z undo
         if event.modifiers() & Qt.ControlModifier and k == Qt.Key_Z:
-            if self._undo_stack:
+            if self._history.can_undo():
                 self._do_undo()
                 event.accept()
                 return
 
         # Ctrl+Y redo
         if event.modifiers() & Qt.ControlModifier and k == Qt.Key_Y:
-            if self._redo_stack:
+            if self._history.can_redo():
                 self._do_redo()
                 event.accept()
                 return
 
         if changed:
-            if self.last_mouse_pt is not None:
-                self._update_preview(self.last_mouse_pt)
-            self._update_radius_label()
+            self._redraw.request(self._redraw_frame)
             event.accept()
         else:
             super().keyPressEvent(event)
 
     def _do_undo(self):
-        # snapshot current state into redo, restore last undo snapshot to points/radii/next_point_radius
-        current_pts = [QgsPointXY(p) for p in self.points]
-        current_radii = [r for r in self._radii]
-        current_next = None if self.next_point_radius is None else float(self.next_point_radius)
-        self._redo_stack.append((current_pts, current_radii, current_next))
-
-        pts_snap, radii_snap, next_snap = self._undo_stack.pop()
-        self.points = [QgsPointXY(p) for p in pts_snap]
-        self._radii = [r for r in radii_snap]
-        self.next_point_radius = None if next_snap is None else float(next_snap)
+        # revert the last step; its point/radius operations and the saved next_point_radius go to redo
+        self._history.undo(self)
 
         # update rubber band and preview
-        self.perm_rb.reset(QgsWkbTypes.LineGeometry)
-        for p in self.points:
-            self.perm_rb.addPoint(p, False)
+        self._show_sketch()
         self._update_preview(self.last_mouse_pt if self.last_mouse_pt else None)
         self._update_radius_label()
 
     def _do_redo(self):
-        # snapshot current to undo, restore from redo
-        current_pts = [QgsPointXY(p) for p in self.points]
-        current_radii = [r for r in self._radii]
-        current_next = None if self.next_point_radius is None else float(self.next_point_radius)
-        self._undo_stack.append((current_pts, current_radii, current_next))
+        # re-apply the last undone step
+        self._history.redo(self)
 
-        pts_snap, radii_snap, next_snap = self._redo_stack.pop()
-        self.points = [QgsPointXY(p) for p in pts_snap]
-        self._radii = [r for r in radii_snap]
-        self.next_point_radius = None if next_snap is None else float(next_snap)
-
-        self.perm_rb.reset(QgsWkbTypes.LineGeometry)
-        for p in self.points:
-            self.perm_rb.addPoint(p, False)
+        self._show_sketch()
         self._update_preview(self.last_mouse_pt if self.last_mouse_pt else None)
         self._update_radius_label()
 
-    def _build_filleted_points(self, pts_list, radii_for_pts=None):
-        """
-        Build filleted polyline from pts_list.
-        radii_for_pts (optional): list aligned to pts_list providing per-point radius or None to use global.
-        radii_for_pts[i] is the radius to use when pts_list[i] is the corner (i.e., middle point).
-        """
-        if len(pts_list) < 3:
-            return list(pts_list)
-        new_pts = [QgsPointXY(pts_list[0])]
-        n = len(pts_list)
-        # ensure radii_for_pts length
-        if radii_for_pts is None:
-            radii_for_pts = [None] * n
-        else:
-            # pad if shorter
-            radii_for_pts = list(radii_for_pts) + [None] * max(0, n - len(radii_for_pts))
-
-        for i in range(1, n-1):
-            prev_p = pts_list[i-1]
-            cur_p = pts_list[i]
-            next_p = pts_list[i+1]
-            # choose radius: prefer radii_for_pts for this index, otherwise global self.radius
-            r = radii_for_pts[i] if i < len(radii_for_pts) and radii_for_pts[i] is not None else self.radius
-            seg = fillet_three_points(prev_p, cur_p, next_p, r, self.segs)
-            for q in seg:
-                if len(new_pts) > 0:
-                    last = new_pts[-1]
-                    if abs(last.x() - q.x()) < 1e-9 and abs(last.y() - q.y()) < 1e-9:
-                        continue
-                new_pts.append(q)
-        lastpt = pts_list[-1]
-        if len(new_pts) == 0 or not (abs(new_pts[-1].x() - lastpt.x()) < 1e-9 and abs(new_pts[-1].y() - lastpt.y()) < 1e-9):
-            new_pts.append(QgsPointXY(lastpt))
-        return new_pts
+    # --- sketch edits used by the undo/redo history; each keeps the preview cache in sync ---
+    def append_point(self, pt, radius=None):
+        self.sketch.append(pt[0], pt[1], radius)
+
+    def pop_point(self):
+        self.sketch.pop()
+        self._preview_cache.invalidate_point(len(self.sketch))
+
+    def set_corner_radius(self, index, radius):
+        self.sketch.set_radius(index, radius)
+        self._preview_cache.invalidate(index)
+
+    def _corner_radius(self, i):
+        r = self.sketch.radius(i)
+        return self.radius if r is None else r
+
+    def _invalidate_global_radius(self):
+        # only corners without their own radius follow the global one
+        for i in range(1, len(self.sketch)):
+            if self.sketch.radius(i) is None:
+                self._preview_cache.invalidate(i)
+                return
+
+    @staticmethod
+    def _to_qgs_points(xs, ys):
+        # the geometry core works on plain floats; QGIS objects are only built for display/output
+        return [QgsPointXY(x, y) for x, y in zip(xs, ys)]
+
+    @property
+    def layer(self):
+        return self._writer.layer
+
+    @layer.setter
+    def layer(self, layer):
+        # lines queued for the previous layer are written before switching
+        self._writer.set_layer(layer)
+        if self.isActive():
+            self.crs.attach(layer)
+            self._update_snap_index()
+
+    @property
+    def work_crs(self):
+        # CRS the fillets are computed in: 'canvas', 'layer' or 'local' (metric, centred on the line)
+        return self.crs.mode
+
+    @work_crs.setter
+    def work_crs(self, mode):
+        self.crs.set_mode(mode)
+        if self.isActive() and len(self.sketch) > 0:
+            self.crs.set_local_origin(self.crs.to_canvas(*self.sketch.point(0)))
+
+    def _on_crs_changed(self, old_work):
+        # transforms were rebuilt: move the sketch into the new working CRS and redraw from scratch
+        new_work = self.crs.work_crs
+        self.snapper.set_map_crs(self.crs.canvas_crs())
+        if len(self.sketch) > 0 and old_work is not None and old_work != new_work:
+            ct = QgsCoordinateTransform(old_work, new_work, QgsProject.instance().transformContext())
+            self.sketch.replace_coords(*transform_xy(ct, self.sketch.xs, self.sketch.ys))
+            # recorded steps hold coordinates of the old working CRS
+            self._history.clear()
+        self._preview_cache.clear()
+        self._fit = []
+        self._prefix_conflicts = (None, [])
+        if len(self.sketch) > 0:
+            self._show_sketch()
+            self._update_preview(self.last_mouse_pt)
+
+    @property
+    def snap_layers(self):
+        # extra layers to snap to besides the target layer
+        return list(self._snap_layers)
+
+    @snap_layers.setter
+    def snap_layers(self, layers):
+        self._snap_layers = [lyr for lyr in layers if lyr is not None]
+        if self.isActive():
+            self._update_snap_index()
+
+    def _update_snap_index(self):
+        # indexes of layers already indexed are kept and stay current through layer signals
+        self.snapper.set_layers([self.layer] + self._snap_layers)
+
+    def _snap(self, pt):
+        # snapped copy of the map point pt (or pt itself); updates the snap marker
+        try:
+            match = self.snapper.snap(pt, self.canvas.mapUnitsPerPixel())
+        except Exception:
+            match = None
+        self._show_snap(match)
+        return QgsPointXY(match.point) if match is not None else pt
+
+    def _snapped_map_point(self, pos):
+        return self._snap(QgsPointXY(self.toMapCoordinates(pos)))
+
+    def _show_snap(self, match):
+        self._snap_match = match
+        self.snap_rb.reset(QgsWkbTypes.PointGeometry)
+        if match is None:
+            return
+        self.snap_rb.setIcon(QgsRubberBand.ICON_BOX if match.kind == SNAP_VERTEX else QgsRubberBand.ICON_CIRCLE)
+        self.snap_rb.addPoint(match.point, True)
+        self.snap_rb.show()
+
+    def _queue_feature(self, feat):
+        # keep the line on screen until the writer hands it to the layer; the next line can snap to
+        # a queued line and is checked against it before it is written
+        self.pending_rb.addGeometry(feat.geometry(), self.layer)
+        index = self.snapper.index_for(self.layer)
+        pid = index.add_pending(feat.geometry()) if index is not None else None
+        self._queued.append((feat, self.layer, index, pid))
+        self._writer.add(feat)
+
+    def _on_features_flushed(self, written, failed):
+        # the layer draws (and indexes) the written lines itself now; refused ones stay on the band
+        done = self._queued[:written + len(failed)]
+        del self._queued[:written + len(failed)]
+        refused = set(id(feat) for feat in failed)
+        for feat, layer, index, pid in done:
+            if index is not None and pid is not None:
+                index.drop_pending([pid])
+            if id(feat) in refused:
+                self._unsaved.append((feat.geometry(), layer))
+        self.pending_rb.reset(QgsWkbTypes.LineGeometry)
+        for feat, layer, _, _ in self._queued:
+            self.pending_rb.addGeometry(feat.geometry(), layer)
+        for geom, layer in self._unsaved:
+            self.pending_rb.addGeometry(geom, layer)
+        if failed:
+            self._notify("Fillet warning",
+                         "{} line(s) could not be written to the layer; they stay highlighted until the "
+                         "tool is deactivated.".format(len(failed)))
+
+    def _preview_max_error(self):
+        # allowed chord error of preview arcs in map units, from the current canvas scale
+        if self.preview_tolerance_px is None:
+            return None
+        try:
+            return self.preview_tolerance_px * self.canvas.mapUnitsPerPixel() * self.crs.work_per_canvas
+        except Exception:
+            return None
 
     def _update_preview(self, moving_pt):
-        self.preview_rb.reset(QgsWkbTypes.LineGeometry)
-        if len(self.points) == 0:
-            self.preview_rb.show()
+        if self._finishing():
+            # the sketch is frozen until the finished line's check returns
+            return
+        self.cross_rb.reset(QgsWkbTypes.PointGeometry)
+        if len(self.sketch) < 2 or moving_pt is None:
+            self._cancel_validation()
+        if len(self.sketch) == 0 or moving_pt is None:
+            self._show_conflicts([])
+            self._set_band_line(self.prefix_rb, (), ())
+            self._set_band_line(self.preview_rb, (), ())
+            self._set_band_lines(self.edge_prefix_rb, ())
+            self._set_band_lines(self.edge_rb, ())
             return
-        pts_for_preview = self.points + [QgsPointXY(moving_pt)]
-        if len(pts_for_preview) < 3:
-            for i, p in enumerate(pts_for_preview):
-                self.preview_rb.addPoint(p, i == len(pts_for_preview)-1)
-            self.preview_rb.show()
+        mx, my = self.crs.to_work(moving_pt)
+        if len(self.sketch) < 2:
+            x0, y0 = self.sketch.point(0)
+            conflicts = self._layer_conflicts((x0, mx), (y0, my))
+            self._show_conflicts(conflicts)
+            self._set_preview_state(True, conflicts)
+            self._set_band_line(self.prefix_rb, (), ())
+            self._set_band_line(self.preview_rb, (x0, mx), (y0, my))
+            self._set_band_lines(self.edge_prefix_rb, ())
+            self._set_band_lines(self.edge_rb, [offset_polyline_xy((x0, mx), (y0, my), (), offset)
+                                                for offset in self.edge_offsets])
             return
 
-        # build radii_for_preview aligned with pts_for_preview
-        radii_preview = []
-        for i in range(len(self.points)):
-            if i < len(self._radii):
-                radii_preview.append(self._radii[i])
-            else:
-                radii_preview.append(None)
-        # append None for the moving point
-        radii_preview.append(None)
+        prof = self.profiler
+        idx = len(self.sketch) - 1
         # if user has a temporary next_point_radius (editing the last placed point), apply it to that corner
-        if self.next_point_radius is not None and len(self.points) >= 1:
-            # the corner to be filleted is the last placed point, which is index len(self.points)-1
-            idx = len(self.points)-1
-            if idx >= 0 and idx < len(radii_preview):
-                radii_preview[idx] = float(self.next_point_radius)
+        if self.next_point_radius is not None:
+            r_tail = float(self.next_point_radius)
+        else:
+            r_tail = self._corner_radius(idx)
+        radius_for = self._corner_radius
+        cache = self._preview_cache
+        max_error = self._preview_max_error()
+        r_request = r_tail
+        if self.auto_fit:
+            with prof.stage('preview.fit'):
+                r_tail = self._fit_preview(mx, my, r_request, max_error)
+            radius_for = lambda i: self._fit[i]
+        xs, ys, first_new_seg = self._preview_line(mx, my, r_tail, radius_for, max_error, prof)
 
-        preview_pts = self._build_filleted_points(pts_for_preview, radii_for_pts=radii_preview)
+        # check geometry validity (self-intersection / invalid); the cached prefix was checked
+        # when it was built, so only the new tail segments need testing here. Long lines are
+        # checked in the background and drawn as "validating" until the result arrives.
+        if len(xs) >= BACKGROUND_MIN_VERTICES:
+            job = self.validator.submit(xs, ys, first_new_seg, cache.crossings)
+            self._show_crossings(cache.crossings)
+            valid = None
+        else:
+            self._cancel_validation()
+            with prof.stage('preview.self_check') as st:
+                st.vertices = len(xs)
+                crossings, valid = check_line(xs, ys, first_new_seg, cache.crossings)
+            if self.auto_fit and crossings and self._needs_refit(crossings, max_error):
+                # the analytic fit was not enough: bisect the radii of the crossing corners
+                with prof.stage('preview.fit_bisect') as st:
+                    st.vertices = len(xs)
+                    r_tail = self._refit_preview(mx, my, r_request, max_error,
+                                                 len(crossings) > len(cache.crossings))
+                xs, ys, first_new_seg = self._preview_line(mx, my, r_tail, radius_for, max_error, prof)
+                crossings, valid = check_line(xs, ys, first_new_seg, cache.crossings)
+            self._show_crossings(crossings)
 
-        # check geometry validity (self-intersection / invalid)
-        try:
-            # prefer robust segment-pair test for self-intersection
-            valid = not polyline_self_intersects(preview_pts)
-        except Exception:
-            try:
-                geom = QgsGeometry.fromPolylineXY(preview_pts)
-                valid = geom.isGeosValid()
-            except Exception:
-                valid = True
+        # crossings with existing features: the prefix result is kept until the cache changes,
+        # so each frame only queries the index around the tail
+        conflicts = []
+        if self.check_layer_crossings:
+            with prof.stage('preview.layer_check') as st:
+                st.vertices = len(xs) - first_new_seg
+                revision = (cache.revision, self._index_revision())
+                if self._prefix_conflicts[0] != revision:
+                    self._prefix_conflicts = (revision, self._layer_conflicts(cache.xs, cache.ys))
+                conflicts = self._prefix_conflicts[1] + [
+                    fid for fid in self._layer_conflicts(xs, ys, first_new_seg) if fid not in self._prefix_conflicts[1]]
+        self._show_conflicts(conflicts)
+        if valid is None:
+            self._validation = ('preview', job, conflicts)
 
-        # adjust preview color and label when invalid
-        if not valid:
-            self.preview_rb.setColor(self.preview_color_bad)
+        self._set_preview_state(valid, conflicts)
+        with prof.stage('preview.bands') as st:
+            # the prefix band is only redrawn when the cache changed; the tail band starts at
+            # the prefix's last vertex, so the two join up
+            st.vertices = len(xs) - first_new_seg
+            if self._prefix_shown != cache.revision:
+                self._set_band_line(self.prefix_rb, cache.xs, cache.ys)
+                self._prefix_shown = cache.revision
+                st.vertices += len(cache.xs)
+            self._set_band_line(self.preview_rb, xs[first_new_seg:], ys[first_new_seg:])
+        if self.edge_offsets:
+            with prof.stage('preview.edges') as st:
+                st.vertices = self._show_edges(mx, my, r_tail, max_error)
+        # rubber bands repaint their own canvas items; no full map refresh is needed
+
+    def _preview_line(self, mx, my, r_tail, radius_for, max_error, prof):
+        # committed corners come from the cache; only the corner at the last placed point follows the mouse
+        cache = self._preview_cache
+        with prof.stage('preview.cache') as st:
+            cache.sync(self.sketch, radius_for, self.segs, max_error, self.edge_offsets)
+            st.vertices = len(cache.xs)
+
+        with prof.stage('preview.tail') as st:
+            xs = array('d', cache.xs)
+            ys = array('d', cache.ys)
+            first_new_seg = len(xs) - 1
+            idx = len(self.sketch) - 1
+            px, py = self.sketch.point(idx - 1)
+            x, y = self.sketch.point(idx)
+            append_fillet(xs, ys, px, py, x, y, mx, my, r_tail, self.segs, max_error)
+            append_unique(xs, ys, mx, my)
+            st.vertices = len(xs) - first_new_seg
+        return xs, ys, first_new_seg
+
+    def _show_edges(self, mx, my, r_tail, max_error):
+        # edge lines: cached prefixes (redrawn when the cache changes) plus, per edge, the corner at
+        # the last placed point and the end beside the mouse; returns the number of vertices drawn
+        cache = self._preview_cache
+        drawn = 0
+        if self._edges_shown != cache.revision:
+            self._set_band_lines(self.edge_prefix_rb, cache.edges)
+            self._edges_shown = cache.revision
+            drawn += sum(len(exs) for exs, _ in cache.edges)
+        idx = len(self.sketch) - 1
+        px, py = self.sketch.point(idx - 1)
+        x, y = self.sketch.point(idx)
+        tails = []
+        for (exs, eys), offset in zip(cache.edges, self.edge_offsets):
+            txs = array('d', exs[-1:])
+            tys = array('d', eys[-1:])
+            append_offset_corner(txs, tys, px, py, x, y, mx, my, r_tail, offset, self.segs, max_error)
+            append_unique(txs, tys, *offset_point(x, y, mx, my, offset, at_end=True))
+            tails.append((txs, tys))
+            drawn += len(txs)
+        self._set_band_lines(self.edge_rb, tails)
+        return drawn
+
+    def set_edge_offsets(self, offsets):
+        # signed offsets of the edge lines (empty: none); the preview cache rebuilds with them
+        self.edge_offsets = tuple(float(o) for o in offsets)
+        self._edges_shown = None
+        self._redraw.request(self._redraw_frame)
+
+    def _fit_preview(self, mx, my, r_tail, max_error):
+        """
+        Auto-fit radii of the preview line (placed points plus the mouse) into self._fit and
+        return the tail corner's. The analytic fit only runs forward, so the placed part is
+        fitted once per sketch edit and each frame just refits the last two corners; placed
+        corners bisected by _refit_preview keep their bisected radius.
+        """
+        sketch = self.sketch
+        key = (sketch.revision, self.radius)
+        if self._sketch_fit[0] != key:
+            self._sketch_fit = (key, max_tangent_radii(
+                sketch.xs, sketch.ys, [self._corner_radius(i) for i in range(len(sketch))]))
+        fit = list(self._sketch_fit[1])
+        idx = len(sketch) - 1
+        refit_key, _, bisected, _ = self._sketch_refit
+        if refit_key == self._refit_key(max_error):
+            for i in range(1, idx):
+                fit[i] = min(fit[i], bisected[i])
+        if idx >= 2:
+            window = max_tangent_radii(sketch.xs[idx-2:] + array('d', (mx,)), sketch.ys[idx-2:] + array('d', (my,)),
+                                       (0.0, fit[idx-1], r_tail, 0.0))
+            fit[idx-1] = window[1]
+            r_tail = window[2]
+        else:
+            r_tail = max_tangent_radii(sketch.xs + array('d', (mx,)), sketch.ys + array('d', (my,)),
+                                       (0.0, r_tail, 0.0))[1]
+        fit[idx] = r_tail
+        fit.append(self.radius)  # the mouse end point (never a corner)
+        self._apply_fit(fit)
+        return r_tail
+
+    def _refit_key(self, max_error):
+        return self.sketch.revision, self.radius, self.segs, max_error
+
+    def _needs_refit(self, crossings, max_error):
+        # new crossings at the mouse, or placed corners not bisected since the last sketch edit
+        return (len(crossings) > len(self._preview_cache.crossings)
+                or self._sketch_refit[0] != self._refit_key(max_error))
+
+    def _refit_preview(self, mx, my, r_tail, max_error, tail):
+        """
+        Bisection part of the auto-fit; returns the tail corner's radius. The placed corners are
+        bisected once per sketch edit, from the first corner the edit touched on (the ones before
+        keep their cached radii), and _fit_preview applies the result on every later frame. With
+        `tail` (new crossings at the mouse) the two corners next to the mouse are bisected too,
+        for this frame only. Placed corners whose crossing stays at radius 0 are not retried.
+        """
+        sketch = self.sketch
+        n = len(sketch)
+        key = self._refit_key(max_error)
+        old_key, old_points, old_radii, old_unfixed = self._sketch_refit
+        if old_key != key:
+            points = [(sketch.xs[i], sketch.ys[i], self._corner_radius(i)) for i in range(n)]
+            common = 0
+            if old_key is not None and old_key[1:] == key[1:]:
+                last = min(n, len(old_points))
+                while common < last and points[common] == old_points[common]:
+                    common += 1
+            # corner i depends on points i-1 .. i+1
+            first = max(1, common - 1)
+            radii = list(self._sketch_fit[1])
+            for i in range(1, min(first, len(old_radii))):
+                radii[i] = min(radii[i], old_radii[i])
+            unfixed = {c for c in old_unfixed if c < first}
+            radii, stuck = refit_corners(sketch.xs, sketch.ys, radii, first, unfixed, self.segs, max_error)
+            self._sketch_refit = (key, points, radii, frozenset(unfixed.union(stuck)))
+            r_tail = self._fit_preview(mx, my, r_tail, max_error)
+        else:
+            r_tail = self._fit[n - 1]
+        if tail and n >= 2:
+            xs = sketch.xs + array('d', (mx,))
+            ys = sketch.ys + array('d', (my,))
+            # only the corners next to the mouse: the placed ones were settled above
+            fit, _ = refit_corners(xs, ys, self._fit, max(1, n - 2), range(1, n - 2), self.segs, max_error)
+            self._apply_fit(fit)
+            r_tail = fit[n - 1]
+        return r_tail
+
+    def _apply_fit(self, fit):
+        # drop the cached arcs from the first corner whose fitted radius changed
+        old = self._fit
+        cached = len(self.sketch) - 2  # corners 1..cached are in the preview cache
+        # index 0 is the start point, not a corner: it never invalidates anything
+        first = next((i for i in range(1, cached + 1) if i >= len(old) or old[i] != fit[i]), None)
+        if first is not None:
+            self._preview_cache.invalidate(first)
+        self._fit = fit
+
+    def set_auto_fit(self, enabled):
+        self.auto_fit = enabled
+        self._fit = []
+        self._preview_cache.invalidate(1)
+
+    def _set_preview_state(self, valid, conflicts):
+        # adjust preview color and label when invalid; valid None -> still validating
+        self._validating = valid is None and not conflicts
+        if self._validating:
+            color = self.preview_color_pending
+            self._last_preview_invalid = False
+        elif not valid or conflicts:
+            color = self.preview_color_bad
             self._last_preview_invalid = True
         else:
-            self.preview_rb.setColor(self.preview_color_ok)
+            color = self.preview_color_ok
             self._last_preview_invalid = False
+        if color is not self._preview_color:
+            # recoloring repaints the whole prefix band, so only do it on a state change
+            self._preview_color = color
+            self.prefix_rb.setColor(color)
+            self.preview_rb.setColor(color)
 
-        for i, p in enumerate(preview_pts):
-            self.preview_rb.addPoint(p, i == len(preview_pts)-1)
-        self.preview_rb.show()
         # if invalid, update label to include warning
         if self._last_preview_invalid:
             # red background for warning
             self.radius_label.setStyleSheet("background: rgba(180,0,0,220); color: white; padding:4px; border-radius:4px;")
-            text = "Radius: {:.2f}  (Warning: self-intersect)".format(self.radius)
+            reason = "self-intersect" if valid is False else "crosses existing feature"
+            text = "Radius: {:.2f}  (Warning: {})".format(self.radius, reason)
             self.radius_label.setText(text)
             self.radius_label.adjustSize()
         else:
             # restore normal style
             self.radius_label.setStyleSheet("background: rgba(0,0,0,180); color: white; padding:4px; border-radius:4px;")
+
+    def _layer_conflicts(self, xs, ys, start=0):
+        # ids of target-layer features crossed by the line from vertex `start` on
+        if not self.check_layer_crossings:
+            return []
         try:
-            self.canvas.refresh()
+            exclude = () if self._editing_fid is None else (self._editing_fid,)
+            if self.crs.work_to_layer is not None:
+                xs, ys = transform_xy(self.crs.work_to_layer, xs[start:], ys[start:])
+                start = 0
+            return layer_conflicts(self.snapper.index_for(self.layer), xs, ys, start, exclude)
         except Exception:
-            pass
+            return []
+
+    def _index_revision(self):
+        index = self.snapper.index_for(self.layer)
+        return index.revision if index is not None else None
+
+    def _show_conflicts(self, fids):
+        # highlight the existing features the current line would cross
+        shown = (list(fids), self._index_revision())
+        if shown == self._shown_conflicts:
+            return
+        self._shown_conflicts = shown
+        self.conflict_rb.reset(QgsWkbTypes.LineGeometry)
+        index = self.snapper.index_for(self.layer)
+        if index is None:
+            return
+        for fid in fids:
+            self.conflict_rb.addGeometry(index.geometry(fid), self.layer)
+        self.conflict_rb.show()
+
+    def _set_band_line(self, band, xs, ys):
+        # replace the band's vertices with a single geometry set (one canvas item update),
+        # built straight from the coordinate columns
+        if len(xs) < 2:
+            band.reset(QgsWkbTypes.LineGeometry)
+            if band is self.prefix_rb:
+                self._prefix_shown = None
+            return
+        geom = QgsGeometry(QgsLineString(list(xs), list(ys)))
+        if self.crs.work_to_canvas is not None:
+            # coordinates are in the working CRS; one transform call for the whole band
+            geom.transform(self.crs.work_to_canvas)
+        band.setToGeometry(geom, None)
+
+    def _set_band_lines(self, band, lines):
+        # several (xs, ys) lines in one band, as one geometry set
+        multi = QgsMultiLineString()
+        for xs, ys in lines:
+            if len(xs) >= 2:
+                multi.addGeometry(QgsLineString(list(xs), list(ys)))
+        if multi.numGeometries() == 0:
+            band.reset(QgsWkbTypes.LineGeometry)
+            if band is self.edge_prefix_rb:
+                self._edges_shown = None
+            return
+        geom = QgsGeometry(multi)
+        if self.crs.work_to_canvas is not None:
+            geom.transform(self.crs.work_to_canvas)
+        band.setToGeometry(geom, None)
+
+    def _show_sketch(self):
+        # static band of the placed points, redrawn only when the sketch changes
+        self._sketch_dirty = False
+        self._set_band_line(self.perm_rb, self.sketch.xs, self.sketch.ys)
+        self._update_guide()
+
+    def _update_guide(self):
+        if len(self.sketch) == 0 or self.last_mouse_pt is None:
+            self.guide_rb.reset(QgsWkbTypes.LineGeometry)
+            return
+        x, y = self.sketch.point(-1)
+        mx, my = self.crs.to_work(self.last_mouse_pt)
+        self._set_band_line(self.guide_rb, (x, mx), (y, my))
+
+    def _show_crossings(self, crossings):
+        # mark each self-intersection of the current preview/final line
+        self.cross_rb.reset(QgsWkbTypes.PointGeometry)
+        for i, (_, _, x, y) in enumerate(crossings):
+            self.cross_rb.addPoint(self.crs.to_canvas(x, y), i == len(crossings)-1)
+        self.cross_rb.show()
+
+    def set_profiling(self, enabled):
+        self.profiler.enabled = enabled
+        self.profiler.reset()
+        self._update_perf_hud()
+
+    def export_performance(self, path=None):
+        # write the current per-stage summary as CSV or JSON (by extension); asks for a path if none given
+        if path is None:
+            path, _ = QFileDialog.getSaveFileName(None, "Export fillet tool timings", "fillet_timings.csv",
+                                                  "CSV (*.csv);;JSON (*.json)")
+            if not path:
+                return None
+        self.profiler.export(path)
+        return path
+
+    def toggle_recording(self, path=None):
+        # start recording input events, or stop and save them (asks for a path if none given)
+        if self.recorder is None:
+            self.recorder = SessionRecorder(self)
+            self.recorder.start()
+            self._update_radius_label()
+            return None
+        recorder, self.recorder = self.recorder, None
+        self._update_radius_label()
+        if path is None:
+            path, _ = QFileDialog.getSaveFileName(None, "Save fillet session recording", "fillet_session.fsr.gz",
+                                                  "Fillet session (*.fsr.gz)")
+            if not path:
+                return None
+        return recorder.save(path)
+
+    def _notify(self, title, text, warning=True):
+        if self.messages is not None:
+            self.messages.append(text)
+        elif warning:
+            QMessageBox.warning(None, title, text)
+        else:
+            QMessageBox.information(None, title, text)
+
+    def _update_perf_hud(self):
+        if not self.profiler.enabled:
+            self.perf_label.hide()
+            return
+        self.perf_label.setText(self.profiler.format_hud())
+        self.perf_label.adjustSize()
+        # below the radius label
+        pos = self.radius_label.pos()
+        self.perf_label.move(pos.x(), pos.y() + self.radius_label.height() + 4)
+        self.perf_label.show()
 
     def _update_radius_label(self):
         # Show Next corner radius when temporary override exists; otherwise show Default radius
-        if self.next_point_radius is not None and len(self.points) >= 1:
+        if self.next_point_radius is not None and len(self.sketch) >= 1:
             text = "Next corner radius: {:.2f}".format(self.next_point_radius)
         else:
             text = "Default radius: {:.2f}".format(self.radius)
+        if self.auto_fit:
+            text += "  [auto-fit]"
+        if self.stream_mode:
+            text += "  [stream]"
+        if self.curve_output:
+            # densified anyway when the layer can not store curves
+            text += "  [arcs]" if supports_curves(self.layer) else "  [arcs: n/a]"
+        if self.edge_offsets:
+            text += "  [edges \u00b1{:.2f}]".format(self.edge_offset)
+        if self.work_crs != WORK_CRS_MODES[0]:
+            text += "  [{} CRS]".format(self.work_crs)
+        if self.recorder is not None:
+            text += "  [rec]"
 
         # if last preview invalid, append warning (kept short; full message shown on double click)
         if self._last_preview_invalid:
             text += "  (invalid)"
             self.radius_label.setStyleSheet("background: rgba(180,0,0,220); color: white; padding:4px; border-radius:4px;")
+        elif self._validating:
+            text += "  (validating...)"
+            self.radius_label.setStyleSheet("background: rgba(0,0,0,180); color: white; padding:4px; border-radius:4px;")
         else:
             self.radius_label.setStyleSheet("background: rgba(0,0,0,180); color: white; padding:4px; border-radius:4px;")
         self.radius_label.setText(text)
@@ -520,7 +1394,23 @@ class FilletDigitizeTool(QgsMapTool):
         self.radius_label.show()
 
     def deactivate(self):
+        if self._stream.active:
+            self._end_stroke()
+        self.crs.detach()
+        self._redraw.cancel()
+        self._cancel_validation()
+        self._writer.flush()
+        self._unsaved = []
+        self.pending_rb.reset(QgsWkbTypes.LineGeometry)
         self.perm_rb.reset(QgsWkbTypes.LineGeometry)
+        self.guide_rb.reset(QgsWkbTypes.LineGeometry)
+        self._set_band_line(self.prefix_rb, (), ())
         self.preview_rb.reset(QgsWkbTypes.LineGeometry)
+        self._set_band_lines(self.edge_prefix_rb, ())
+        self._set_band_lines(self.edge_rb, ())
+        self.cross_rb.reset(QgsWkbTypes.PointGeometry)
+        self._show_conflicts([])
+        self._show_snap(None)
         self.radius_label.hide()
+        self.perf_label.hide()
         super().deactivate()
\ No newline at end of file
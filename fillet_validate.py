@@ -0,0 +1,100 @@
+# fillet_validate.py
+# Background validation of the fillet preview/final line: the self-intersection test (with the
+# GEOS validity check as fallback) runs in a QgsTask on an immutable copy of the coordinates,
+# and only the result for the most recently submitted state is delivered.
+
+import time
+
+from qgis.PyQt.QtCore import QObject, pyqtSignal
+from qgis.core import QgsApplication, QgsGeometry, QgsPointXY, QgsTask
+
+from .fillet_core import polyline_intersections
+
+# below this many vertices checking inline is cheaper than starting a task
+BACKGROUND_MIN_VERTICES = 1000
+
+
+def check_line(xs, ys, first_seg=0, known_crossings=(), is_cancelled=None):
+    """
+    Self-intersection check of the line (xs, ys): known_crossings (already found for the
+    segments before first_seg) plus the crossings involving later segments.
+    Returns (crossings, valid).
+    """
+    try:
+        crossings = list(known_crossings) + polyline_intersections(xs, ys, first_seg, is_cancelled=is_cancelled)
+        return crossings, len(crossings) == 0
+    except Exception:
+        # fallback: GEOS validity
+        try:
+            geom = QgsGeometry.fromPolylineXY([QgsPointXY(x, y) for x, y in zip(xs, ys)])
+            return [], geom.isGeosValid()
+        except Exception:
+            return [], True
+
+
+class _ValidationTask(QgsTask):
+
+    def __init__(self, validator, job, xs, ys, first_seg, known_crossings):
+        super().__init__("Validate fillet line", QgsTask.CanCancel | QgsTask.Silent)
+        self.validator = validator
+        self.job = job
+        # immutable copies: the tool keeps editing its own arrays while this runs
+        self.xs = tuple(xs)
+        self.ys = tuple(ys)
+        self.first_seg = first_seg
+        self.known_crossings = tuple(known_crossings)
+        self.crossings = None
+        self.valid = None
+        self.elapsed = 0.0
+
+    def run(self):
+        t0 = time.perf_counter()
+        self.crossings, self.valid = check_line(self.xs, self.ys, self.first_seg, self.known_crossings,
+                                                self.isCanceled)
+        self.elapsed = time.perf_counter() - t0
+        return not self.isCanceled()
+
+    def finished(self, result):
+        # called on the main thread
+        self.validator._task_finished(self, result)
+
+
+class FilletValidator(QObject):
+    """
+    Latest-state-wins validation jobs. submit() returns a job number and cancels the job that
+    was running for an older state; validated(job, crossings, valid, seconds) is emitted for the
+    newest job only, so results for outdated states are never seen by the tool.
+    """
+
+    validated = pyqtSignal(int, object, bool, float)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._job = 0
+        self._tasks = {}  # job -> running task (QgsTask objects must stay referenced while queued)
+
+    @property
+    def pending(self):
+        return any(job == self._job for job in self._tasks)
+
+    def submit(self, xs, ys, first_seg=0, known_crossings=()):
+        self.cancel()
+        task = _ValidationTask(self, self._job, xs, ys, first_seg, known_crossings)
+        self._tasks[self._job] = task
+        QgsApplication.taskManager().addTask(task)
+        return self._job
+
+    def cancel(self):
+        # stale jobs are cancelled; their results (if any) are dropped in _task_finished
+        self._job += 1
+        for task in list(self._tasks.values()):
+            try:
+                task.cancel()
+            except RuntimeError:
+                # already deleted by the task manager
+                pass
+
+    def _task_finished(self, task, result):
+        self._tasks.pop(task.job, None)
+        if result and task.job == self._job:
+            self.validated.emit(task.job, task.crossings, task.valid, task.elapsed)
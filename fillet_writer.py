@@ -0,0 +1,99 @@
+# fillet_writer.py
+# Batched writing of finished lines: features are queued and handed to the layer in groups,
+# with a single repaint per group instead of one provider round-trip per double-click.
+
+from qgis.PyQt.QtCore import QObject, QTimer, pyqtSignal
+
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_FLUSH_MS = 1000
+
+
+class BufferedFeatureWriter(QObject):
+    """
+    Queue of finished features for one layer.
+    flush() happens when batch_size features are waiting, flush_ms after the first queued feature,
+    before the layer commits or rolls back its edits, and whenever the owner asks (tool deactivation,
+    switching layers). Editable layers receive the features through their edit buffer, one edit
+    command per feature, so QGIS undo and Save Edits keep working; other layers get a single
+    provider addFeatures() call per batch.
+    `flushed` carries the number of features written and the list of those that were not (the layer
+    refused them, or there was no layer to write to), in queue order.
+    """
+
+    flushed = pyqtSignal(int, object)
+
+    def __init__(self, layer=None, batch_size=DEFAULT_BATCH_SIZE, flush_ms=DEFAULT_FLUSH_MS, parent=None):
+        super().__init__(parent)
+        self.batch_size = batch_size
+        self._queue = []
+        self._layer = None
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.flush)
+        self.flush_ms = flush_ms
+        self.set_layer(layer)
+
+    @property
+    def layer(self):
+        return self._layer
+
+    @property
+    def flush_ms(self):
+        return self._timer.interval()
+
+    @flush_ms.setter
+    def flush_ms(self, value):
+        self._timer.setInterval(max(0, int(value)))
+
+    def set_layer(self, layer):
+        if layer is self._layer:
+            return
+        self.flush()
+        if self._layer is not None:
+            try:
+                self._layer.beforeCommitChanges.disconnect(self._flush_before_edit_end)
+                self._layer.beforeRollBack.disconnect(self._flush_before_edit_end)
+            except (TypeError, RuntimeError):
+                pass
+        self._layer = layer
+        if layer is not None:
+            # Save Edits must see everything that is still queued
+            layer.beforeCommitChanges.connect(self._flush_before_edit_end)
+            layer.beforeRollBack.connect(self._flush_before_edit_end)
+
+    def _flush_before_edit_end(self, *args):
+        # beforeCommitChanges carries a stopEditing flag on newer QGIS versions
+        self.flush()
+
+    def add(self, feature):
+        self._queue.append(feature)
+        if len(self._queue) >= self.batch_size:
+            self.flush()
+        elif not self._timer.isActive():
+            self._timer.start()
+
+    def flush(self):
+        self._timer.stop()
+        if not self._queue:
+            return
+        batch = self._queue
+        self._queue = []
+        layer = self._layer
+        failed = batch
+        if layer is not None:
+            if layer.isEditable():
+                failed = []
+                for feat in batch:
+                    layer.beginEditCommand("Add filleted line")
+                    if layer.addFeature(feat):
+                        layer.endEditCommand()
+                    else:
+                        layer.destroyEditCommand()
+                        failed.append(feat)
+            elif layer.dataProvider().capabilities() & layer.dataProvider().AddFeatures:
+                res, _ = layer.dataProvider().addFeatures(batch)
+                if res:
+                    failed = []
+            if len(failed) < len(batch):
+                layer.triggerRepaint()
+        self.flushed.emit(len(batch) - len(failed), failed)